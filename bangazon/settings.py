@@ -53,7 +53,7 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'bangazonapi.pagination.KeysetPagination',
     'PAGE_SIZE': 10
 }
 
@@ -136,5 +136,58 @@ USE_L10N = True
 USE_TZ = True
 APPEND_SLASH = False
 
+# Versioned cache for product responses, see bangazonapi/catalogcache.py.
+# Set CATALOG_CACHE_BACKEND to a CACHES alias to share it between processes.
+# Without one, writes made by other processes show up after
+# CATALOG_CACHE_LOCAL_TTL seconds.
+CATALOG_CACHE_SIZE = 1024
+CATALOG_CACHE_BACKEND = None
+CATALOG_CACHE_TIMEOUT = 300
+CATALOG_CACHE_LOCAL_TTL = 5
+
+# Seconds to cache /products/facets per filter set, 0 to disable
+PRODUCT_FACETS_CACHE_TTL = 30
+
+# Processes that render product image variants, 0 renders inline
+IMAGE_VARIANT_WORKERS = 2
+
+# Rows per transaction for /products/import, clients may ask for up to the max
+PRODUCT_IMPORT_BATCH_SIZE = 500
+PRODUCT_IMPORT_MAX_BATCH_SIZE = 5000
+
+# Most patches accepted by PATCH /products/bulk
+PRODUCT_BULK_UPDATE_MAX = 5000
+
+# Products read and serialized at a time by /products/export
+PRODUCT_EXPORT_CHUNK_SIZE = 1000
+
+# Default and largest radius of /products?near=
+PRODUCT_NEAR_RADIUS_KM = 50
+PRODUCT_NEAR_MAX_RADIUS_KM = 20000
+
+# Products per category in /productcategories/preview, clients may ask for up to the max
+CATEGORY_PREVIEW_SIZE = 4
+CATEGORY_PREVIEW_MAX_SIZE = 20
+
+# Seconds the id of the open order of a customer is cached
+OPEN_ORDER_CACHE_TTL = 3600
+
+# Most items accepted by /cart/batch
+CART_BATCH_MAX = 100
+
+# Extra attempts at completing an order that lost a lock conflict
+CHECKOUT_RETRIES = 3
+
+# Seconds a response is replayed for a repeated Idempotency-Key, and
+# seconds before a request that never finished can be retried with its
+# key, see bangazonapi/idempotency.py
+IDEMPOTENCY_KEY_TTL = 86400
+IDEMPOTENCY_KEY_LEASE = 30
+
+# Products kept per leaderboard and seconds until a board is recomputed,
+# see bangazonapi/leaderboard.py
+LEADERBOARD_SIZE = 50
+LEADERBOARD_TTL = 600
+
 MEDIA_ROOT = 'media'
 MEDIA_URL = '/media/'
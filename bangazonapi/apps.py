@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BangazonapiConfig(AppConfig):
     name = 'bangazonapi'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import signals
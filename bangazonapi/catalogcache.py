@@ -0,0 +1,170 @@
+"""Versioned read-through cache for catalog responses
+
+Every key carries the current catalog version. Writes to products,
+ratings, line items and categories bump the version (see signals.py),
+so stale entries are never read again and simply age out. Entries live
+in a per-process LRU and, when CATALOG_CACHE_BACKEND names one of the
+CACHES aliases, in that shared backend too. The shared backend also
+holds the version so every process agrees on it.
+
+Without a shared backend each process keeps its own version and never
+sees writes made by another one. Its entries then expire after
+CATALOG_CACHE_LOCAL_TTL seconds, which bounds how stale a response
+can be when several processes serve requests.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY = "catalog-version"
+
+
+class LRUCache:
+    """Thread safe mapping that forgets its least recently used and expired entries"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            expires, value = self._entries[key]
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store a value, for timeout seconds or until evicted when None"""
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local = LRUCache(settings.CATALOG_CACHE_SIZE)
+_local_version = 1
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _shared():
+    alias = settings.CATALOG_CACHE_BACKEND
+    return caches[alias] if alias else None
+
+
+def catalog_version():
+    """Current catalog version
+
+    Returns:
+        int -- Version stamp that changes whenever the catalog does
+    """
+    shared = _shared()
+    if shared is None:
+        return _local_version
+
+    version = shared.get(VERSION_KEY)
+    if version is None:
+        shared.add(VERSION_KEY, 1, timeout=None)
+        version = shared.get(VERSION_KEY, 1)
+    return version
+
+
+def _bump():
+    global _local_version  # pylint: disable=global-statement
+    _local_version += 1
+
+    shared = _shared()
+    if shared is not None:
+        try:
+            shared.incr(VERSION_KEY)
+        except ValueError:
+            shared.add(VERSION_KEY, 2, timeout=None)
+
+
+def bump_catalog_version():
+    """Move the catalog to a new version so cached responses are rebuilt
+
+    The version moves right away, so the writing transaction reads its own
+    changes, and again on commit, so nothing cached by another request
+    while the transaction was open outlives it.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def fetch(key, build):
+    """Read a value through the cache, building it on a miss
+
+    Arguments:
+        key {str} -- Cache key without the version
+        build {callable} -- Returns the value to cache, may raise to skip caching
+
+    Returns:
+        tuple -- (value, hit) where hit tells if the value came from the cache
+    """
+    versioned_key = f"catalog:{catalog_version()}:{key}"
+
+    value = _local.get(versioned_key)
+    if value is not None:
+        _count("hits")
+        return value, True
+
+    shared = _shared()
+    if shared is not None:
+        value = shared.get(versioned_key)
+        if value is not None:
+            _local.set(versioned_key, value)
+            _count("hits")
+            return value, True
+
+    _count("misses")
+    value = build()
+    if shared is None:
+        # Another process may bump its own version without this one knowing
+        _local.set(versioned_key, value, settings.CATALOG_CACHE_LOCAL_TTL)
+    else:
+        _local.set(versioned_key, value)
+        shared.set(versioned_key, value, settings.CATALOG_CACHE_TIMEOUT)
+    return value, False
+
+
+def stats():
+    """Hit and miss counters for this process
+
+    Returns:
+        dict -- hits, misses, hit_rate, local_entries and version
+    """
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else 0,
+        "local_entries": len(_local),
+        "version": catalog_version(),
+    }
@@ -0,0 +1,62 @@
+"""In-process reference map of product categories
+
+Categories are few and rarely change, yet every product write has to
+check one. The map of ids to names is loaded once per process and
+dropped whenever a category is saved or deleted here (see signals.py).
+An id missing from the map is looked up in the database before it is
+rejected, so a category created by another process is still found.
+"""
+import threading
+from django.db import transaction
+from bangazonapi.models import ProductCategory
+
+_lock = threading.Lock()
+_names = None
+
+
+def category_names():
+    """Every category name keyed by id
+
+    Returns:
+        dict -- Maps category id to name, shared, do not modify
+    """
+    global _names  # pylint: disable=global-statement
+    with _lock:
+        if _names is None:
+            _names = dict(ProductCategory.objects.values_list("id", "name"))
+        return _names
+
+
+def category_id(pk):
+    """Validated id of an existing category
+
+    Raises:
+        ProductCategory.DoesNotExist -- If there is no such category
+
+    Returns:
+        int -- Category id, ready for Product.category_id
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise ProductCategory.DoesNotExist(f"Category '{pk}' does not exist")
+
+    if pk in category_names():
+        return pk
+
+    if not ProductCategory.objects.filter(pk=pk).exists():
+        raise ProductCategory.DoesNotExist(f"Category {pk} does not exist")
+    invalidate()
+    return pk
+
+
+def _clear():
+    global _names  # pylint: disable=global-statement
+    with _lock:
+        _names = None
+
+
+def invalidate():
+    """Forget the map now, and again once the current transaction commits"""
+    _clear()
+    transaction.on_commit(_clear)
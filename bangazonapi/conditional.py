@@ -0,0 +1,66 @@
+"""Conditional GET support for ViewSet handlers
+
+A handler decorated with `conditional` first asks a cheap stamp
+function for the version of the resource. That is usually one indexed
+query over `updated_at` columns. When the client already holds that
+version the handler is skipped and `304 Not Modified` is returned
+without running any serializer.
+"""
+import functools
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def latest(*moments):
+    """Most recent of the given datetimes, ignoring None
+
+    Returns:
+        datetime -- Latest moment, or None if none were given
+    """
+    moments = [moment for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+def conditional(stamp):
+    """Decorate a ViewSet handler with strong ETag and Last-Modified support
+
+    Arguments:
+        stamp {callable} -- Called like the handler, returns a tuple of
+            (version, last_modified) where version is any value whose str()
+            changes with the response and last_modified is a datetime or None.
+            Returning None skips conditional handling.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return handler(self, request, *args, **kwargs)
+
+            stamped = stamp(self, request, *args, **kwargs)
+            if stamped is None:
+                return handler(self, request, *args, **kwargs)
+
+            version, last_modified = stamped
+            digest = hashlib.sha1(
+                f"{request.get_full_path()}|{version}".encode("utf-8")
+            ).hexdigest()
+            etag = quote_etag(digest)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if not_modified is not None:
+                return not_modified
+
+            response = handler(self, request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                response["ETag"] = etag
+                if timestamp is not None:
+                    response["Last-Modified"] = http_date(timestamp)
+            return response
+
+        return wrapper
+
+    return decorator
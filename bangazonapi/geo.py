@@ -0,0 +1,119 @@
+"""Geohash grid used to find products near a point
+
+A geohash names a cell of a global grid, and every extra character
+splits the cell into 32 smaller ones. Products store the hash of their
+coordinates in an indexed column, so "within r km of a point" becomes a
+few index range scans over the cells covering the search circle,
+followed by an exact great-circle distance check on the candidates.
+"""
+import math
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ACos, Cos, Greatest, Least, Radians, Sin
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 12
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+# Sorts after every geohash character, closes a prefix range
+PREFIX_END = "~"
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Geohash of a point
+
+    Returns:
+        str -- Hash with `precision` characters
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    code = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(code) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            code.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(code)
+
+
+def cell_size(precision):
+    """Height and width in degrees of a cell at a precision
+
+    Returns:
+        tuple -- (latitude degrees, longitude degrees)
+    """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=16):
+    """Geohash prefixes of the cells covering a search circle
+
+    The finest precision that covers the bounding box of the circle with
+    at most `max_cells` cells is used.
+
+    Returns:
+        list -- Geohash prefixes, [""] when the circle covers the globe
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    south = max(latitude - lat_delta, -90.0)
+    north = min(latitude + lat_delta, 90.0)
+
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    lng_delta = radius_km / (KM_PER_DEGREE * max(cos_lat, 0.01))
+    if lng_delta >= 180 or north - south >= 180:
+        return [""]
+    west = longitude - lng_delta
+    east = longitude + lng_delta
+
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((south + 90) // height), min(int((north + 90) // height), int(180 / height) - 1) + 1)
+        columns = range(int((west + 180) // width), int((east + 180) // width) + 1)
+        if len(rows) * len(columns) <= max_cells:
+            break
+
+    columns_around = int(360 / width)
+    cells = set()
+    for row in rows:
+        for column in columns:
+            cells.add(encode(
+                (row + 0.5) * height - 90,
+                (column % columns_around + 0.5) * width - 180,
+                precision,
+            ))
+
+    return sorted(cells)
+
+
+def distance_km(latitude, longitude, lat_field="latitude", lng_field="longitude"):
+    """Great-circle distance from a point to a row, as a query expression
+
+    Uses the spherical law of cosines, clamped so rounding can never
+    push the ACos argument outside [-1, 1].
+    """
+    lat = math.radians(latitude)
+    cosine = (
+        Value(math.sin(lat)) * Sin(Radians(F(lat_field)))
+        + Value(math.cos(lat)) * Cos(Radians(F(lat_field)))
+        * Cos(Radians(F(lng_field)) - Value(math.radians(longitude)))
+    )
+    return ACos(Least(Greatest(cosine, Value(-1.0)), Value(1.0)),
+                output_field=FloatField()) * Value(EARTH_RADIUS_KM)
@@ -0,0 +1,131 @@
+"""Idempotency-Key support for ViewSet handlers that change state
+
+A client that may retry a request sends a unique Idempotency-Key
+header with it. The first request with a key claims it and runs the
+handler, then its status and body are stored. Retries with the same
+key get that stored response back without the handler running again,
+for IDEMPOTENCY_KEY_TTL seconds.
+
+A retry that arrives while the first request is still running gets
+409, and reusing a key for a different request gets 422. A claim that
+has not finished after IDEMPOTENCY_KEY_LEASE seconds is taken over by
+the next retry, as its worker most likely died or timed out. Keys are
+scoped to the authenticated user. Responses with a 5xx status are not
+stored, so a retry after a server error runs the handler again.
+"""
+import datetime
+import functools
+import hashlib
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from bangazonapi.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _expiry():
+    return timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def _lease_expiry():
+    return timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE)
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(
+        f"{request.method}|{request.get_full_path()}|{body}".encode("utf-8")
+    ).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """Stored key, and whether this request is the one that claimed it"""
+    IdempotencyKey.objects.filter(user=user, key=key, created_at__lt=_expiry()).delete()
+    while True:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint), True
+        except IntegrityError:
+            stored = IdempotencyKey.objects.filter(user=user, key=key).first()
+        # None when the key expired and was pruned in between, claim it again
+        if stored is not None:
+            break
+
+    abandoned = (
+        stored.status_code is None
+        and stored.fingerprint == fingerprint
+        and stored.created_at < _lease_expiry()
+    )
+    if abandoned:
+        # Only one retry wins the takeover
+        taken = IdempotencyKey.objects.filter(
+            pk=stored.pk, status_code__isnull=True, created_at=stored.created_at
+        ).update(created_at=timezone.now())
+        if taken:
+            return stored, True
+    return stored, False
+
+
+def prune():
+    """Forget keys older than IDEMPOTENCY_KEY_TTL
+
+    Returns:
+        int -- Number of keys removed
+    """
+    removed, _ = IdempotencyKey.objects.filter(created_at__lt=_expiry()).delete()
+    return removed
+
+
+def idempotent(handler):
+    """Decorate a ViewSet handler so retries with the same Idempotency-Key replay its response"""
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return handler(self, request, *args, **kwargs)
+
+        max_length = IdempotencyKey._meta.get_field("key").max_length
+        if not key or len(key) > max_length:
+            return Response(
+                {"message": f"{HEADER} must be 1 to {max_length} characters"},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = _fingerprint(request)
+        stored, claimed = _claim(request.user, key, fingerprint)
+        if not claimed:
+            if stored.fingerprint != fingerprint:
+                return Response(
+                    {"message": f"{HEADER} was already used for a different request"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if stored.status_code is None:
+                return Response(
+                    {"message": f"A request with this {HEADER} is still in progress"},
+                    status=status.HTTP_409_CONFLICT)
+
+            response = Response(stored.body, status=stored.status_code)
+            response[REPLAYED_HEADER] = "true"
+            return response
+
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            stored.delete()
+            raise
+
+        if response.status_code >= 500 or not hasattr(response, "data"):
+            # Let the client try again
+            stored.delete()
+        else:
+            IdempotencyKey.objects.filter(pk=stored.pk).update(
+                status_code=response.status_code,
+                body=json.loads(json.dumps(response.data, cls=DjangoJSONEncoder)))
+        return response
+
+    return wrapper
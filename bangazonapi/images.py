@@ -0,0 +1,98 @@
+"""Content-addressed storage for product images
+
+Images are stored as `products/<sha256 of contents>.<ext>`, so the
+same picture uploaded for many products is kept only once. Uploads are
+hashed and written in chunks and never held in memory as a whole.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+UPLOAD_DIR = "products"
+
+# Characters of base64 text decoded at a time
+BASE64_CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {
+    "png": "png",
+    "jpg": "jpg",
+    "jpeg": "jpg",
+    "gif": "gif",
+    "webp": "webp",
+}
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload is not a supported image"""
+
+
+def _extension(name):
+    extension = EXTENSIONS.get(name.lower().lstrip("."))
+    if extension is None:
+        raise InvalidImage(f"Unsupported image type '{name}'")
+    return extension
+
+
+def store_image(upload, extension=None):
+    """Store an uploaded file under a name derived from its contents
+
+    Arguments:
+        upload {File} -- Uploaded or temporary file to store
+        extension {str} -- Image type, taken from the file name when omitted
+
+    Returns:
+        str -- Storage name to assign to Product.image_path
+    """
+    if extension is None:
+        extension = os.path.splitext(upload.name or "")[1]
+    extension = _extension(extension)
+
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+
+    name = f"{UPLOAD_DIR}/{digest.hexdigest()}.{extension}"
+    if default_storage.exists(name):
+        return name
+
+    upload.seek(0)
+    # Storage reads the file chunk by chunk, or moves it when it is
+    # already a temporary file on disk
+    return default_storage.save(name, upload)
+
+
+def store_base64_image(data_uri):
+    """Decode a `data:image/<type>;base64,...` string into storage
+
+    The text is decoded slice by slice into a spooled temporary file, so
+    the decoded image never sits in memory next to the encoded one.
+    Whitespace, such as the line breaks of wrapped base64, is ignored.
+
+    Returns:
+        str -- Storage name to assign to Product.image_path
+    """
+    header, separator, encoded = data_uri.partition(";base64,")
+    if not separator:
+        raise InvalidImage("Expected a base64 data URI")
+    extension = _extension(header.split("/")[-1])
+
+    with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as decoded:
+        try:
+            pending = ""
+            for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                pending += "".join(encoded[start:start + BASE64_CHUNK_SIZE].split())
+                # Only whole 4 character groups decode on their own, the
+                # rest waits for the next slice
+                whole = len(pending) - len(pending) % 4
+                decoded.write(base64.b64decode(pending[:whole]))
+                pending = pending[whole:]
+            decoded.write(base64.b64decode(pending))
+        except (binascii.Error, ValueError) as ex:
+            raise InvalidImage("Image is not valid base64") from ex
+
+        return store_image(File(decoded, name=f"upload.{extension}"), extension)
@@ -0,0 +1,210 @@
+"""Streaming bulk import of products from CSV or JSON Lines
+
+Rows are read one line at a time, validated against the cached map of
+categories and inserted with bulk_create in batches. Each batch commits
+in its own transaction. A bad row is reported with its number and
+skipped, and the rest of its batch is still imported.
+"""
+import csv
+import json
+from collections import Counter
+from django.db import IntegrityError, transaction
+from bangazonapi import search
+from bangazonapi.catalogcache import bump_catalog_version
+from bangazonapi.categories import category_names
+from bangazonapi.models import Location, Product
+from bangazonapi.signals import adjust_category_counts
+
+# Errors past this many are counted but not listed in the report
+MAX_REPORTED_ERRORS = 1000
+
+CSV_TYPES = ("text/csv",)
+JSONL_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+class ImportReport:
+    """Running totals of an import"""
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "message": message})
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+def decode_lines(stream, encoding="utf-8-sig"):
+    """Text lines of a binary file-like object, read lazily"""
+    for line in stream:
+        yield line.decode(encoding) if isinstance(line, bytes) else line
+
+
+def read_csv(lines):
+    """Yield (row number, dict) for each CSV record after the header"""
+    for number, row in enumerate(csv.DictReader(lines), start=1):
+        yield number, row
+
+
+def read_jsonl(lines):
+    """Yield (row number, dict or error message) for each JSON line"""
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as ex:
+            yield number, f"Invalid JSON: {ex}"
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+class CategoryMap:
+    """Resolves category ids and names without a query per row"""
+
+    def __init__(self):
+        self.ids = set()
+        self.names = {}
+        for category_id, name in category_names().items():
+            self.ids.add(category_id)
+            self.names.setdefault(name.strip().lower(), category_id)
+
+    def resolve(self, row):
+        category_id = row.get("category_id")
+        if category_id not in (None, ""):
+            try:
+                category_id = int(category_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"category_id '{category_id}' is not a number")
+            if category_id not in self.ids:
+                raise ValueError(f"Category {category_id} does not exist")
+            return category_id
+
+        name = row.get("category")
+        if name in (None, ""):
+            raise ValueError("category_id or category is required")
+        try:
+            return self.names[str(name).strip().lower()]
+        except KeyError:
+            raise ValueError(f"Category '{name}' does not exist")
+
+
+def _text(row, field, max_length):
+    value = row.get(field)
+    if value in (None, ""):
+        raise ValueError(f"{field} is required")
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def build_product(row, categories, customer, places=None):
+    """Validated, unsaved Product for one imported row
+
+    Arguments:
+        places {dict} -- Result of Location.table(), used to place the product
+
+    Raises:
+        ValueError -- With a message for the client when the row is invalid
+    """
+    try:
+        price = float(row.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError("price must be a number")
+    if not 0 <= price <= 10000:
+        raise ValueError("price must be between 0 and 10000")
+
+    try:
+        quantity = int(row.get("quantity"))
+    except (TypeError, ValueError):
+        raise ValueError("quantity must be a whole number")
+    if quantity < 0:
+        raise ValueError("quantity cannot be negative")
+
+    product = Product(
+        name=_text(row, "name", 50),
+        description=_text(row, "description", 255),
+        location=_text(row, "location", 50),
+        price=price,
+        quantity=quantity,
+        category_id=categories.resolve(row),
+        customer=customer,
+    )
+    # bulk_create skips the pre_save signal that normally does this
+    if places is not None:
+        product.set_coordinates(places.get(product.location.lower()))
+    return product
+
+
+def _insert(batch, report):
+    """Insert one batch, falling back to row by row if the database refuses it"""
+    products = [product for _, product in batch]
+    try:
+        with transaction.atomic():
+            created = Product.objects.bulk_create(products)
+            search.index_products(created)
+            adjust_category_counts(Counter(product.category_id for product in created))
+    except IntegrityError:
+        created = []
+        for number, product in batch:
+            try:
+                with transaction.atomic():
+                    Product.objects.bulk_create([product])
+                    search.index_products([product])
+                    adjust_category_counts({product.category_id: 1})
+                created.append(product)
+            except IntegrityError as ex:
+                report.error(number, str(ex))
+
+    report.created += len(created)
+    return created
+
+
+def import_products(rows, customer, batch_size):
+    """Import parsed rows for a seller
+
+    Arguments:
+        rows {iterable} -- (row number, dict or error message) pairs
+        customer {Customer} -- Seller that will own the products
+        batch_size {int} -- Rows per bulk_create and transaction
+
+    Returns:
+        ImportReport -- Counts and per-row errors
+    """
+    report = ImportReport()
+    categories = CategoryMap()
+    places = Location.table()
+
+    batch = []
+    for number, row in rows:
+        if isinstance(row, str):
+            report.error(number, row)
+            continue
+        try:
+            batch.append((number, build_product(row, categories, customer, places)))
+        except ValueError as ex:
+            report.error(number, str(ex))
+            continue
+
+        if len(batch) >= batch_size:
+            _insert(batch, report)
+            batch = []
+
+    if batch:
+        _insert(batch, report)
+
+    if report.created:
+        bump_catalog_version()
+    return report
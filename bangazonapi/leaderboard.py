@@ -0,0 +1,110 @@
+"""Best sellers over the last 1, 7 or 30 days
+
+Completed orders add their units to hourly and daily sales buckets (see
+ProductSalesBucket). A leaderboard sums the buckets in its window: the
+last 24 hourly buckets for one day, daily buckets for longer windows.
+The top LEADERBOARD_SIZE products of each board are kept in the cache,
+so a page view reads a short precomputed list rather than aggregating
+sales. The refresh_leaderboards command rebuilds the boards before they
+expire and drops buckets that no window reads any more.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+from bangazonapi.models import ProductCategory, ProductSalesBucket
+
+# Days in each window and the buckets it is summed from
+WINDOWS = {
+    1: ProductSalesBucket.HOUR,
+    7: ProductSalesBucket.DAY,
+    30: ProductSalesBucket.DAY,
+}
+
+# Buckets older than this are not read by any window
+RETENTION = {
+    ProductSalesBucket.HOUR: timedelta(days=2),
+    ProductSalesBucket.DAY: timedelta(days=max(WINDOWS) + 1),
+}
+
+
+def window_start(window, now=None):
+    """Start of the first bucket in a window"""
+    now = now or timezone.now()
+    granularity = WINDOWS[window]
+    start = ProductSalesBucket.period_start(now, granularity)
+    if granularity == ProductSalesBucket.HOUR:
+        return start - timedelta(hours=24 * window - 1)
+    return start - timedelta(days=window - 1)
+
+
+def compute(window, category=None, now=None):
+    """Sum the buckets of a window into a ranking
+
+    Returns:
+        list -- [product id, units] pairs, best seller first
+    """
+    buckets = ProductSalesBucket.objects.filter(
+        granularity=WINDOWS[window],
+        start__gte=window_start(window, now),
+        product__deleted__isnull=True,
+    )
+    if category is not None:
+        buckets = buckets.filter(product__category_id=category)
+
+    ranking = (
+        buckets.values("product_id")
+        .annotate(total=Sum("units"))
+        .order_by("-total", "product_id")
+        .values_list("product_id", "total")[:settings.LEADERBOARD_SIZE]
+    )
+    return [list(row) for row in ranking]
+
+
+def _key(window, category):
+    return f"leaderboard:{window}:{category or 'all'}"
+
+
+def top_sellers(window, category=None):
+    """Precomputed ranking of a window, computed now if it has expired
+
+    Returns:
+        list -- [product id, units] pairs, best seller first
+    """
+    ranking = cache.get(_key(window, category))
+    if ranking is None:
+        ranking = compute(window, category)
+        cache.set(_key(window, category), ranking, settings.LEADERBOARD_TTL)
+    return ranking
+
+
+def refresh(now=None):
+    """Recompute every board, overall and per category
+
+    Returns:
+        int -- Number of boards stored
+    """
+    categories = [None] + list(ProductCategory.objects.values_list("id", flat=True))
+    boards = {
+        _key(window, category): compute(window, category, now)
+        for window in WINDOWS
+        for category in categories
+    }
+    cache.set_many(boards, settings.LEADERBOARD_TTL)
+    return len(boards)
+
+
+def prune(now=None):
+    """Delete buckets older than any window reads
+
+    Returns:
+        int -- Number of buckets deleted
+    """
+    now = now or timezone.now()
+    deleted = 0
+    for granularity, keep in RETENTION.items():
+        deleted += ProductSalesBucket.objects.filter(
+            granularity=granularity, start__lt=now - keep
+        ).delete()[0]
+    return deleted
@@ -0,0 +1,82 @@
+"""Merge repeated line items for the same product into one line with a quantity"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min, Sum
+from bangazonapi.models import OrderProduct
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold line items that repeat a product on an order into the oldest one, "
+        "summing their quantities. Run it before migrating to the one-line-per-product "
+        "constraint. A database from before line item quantities has one row per unit, "
+        "so the rows are counted instead, and the quantity column and the constraint "
+        "are added here; record the migration that adds them with migrate --fake."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report how many lines would be merged",
+        )
+
+    def handle(self, *args, **options):
+        table = OrderProduct._meta.db_table
+        with connection.cursor() as cursor:
+            columns = {
+                column.name
+                for column in connection.introspection.get_table_description(cursor, table)
+            }
+        has_quantity = OrderProduct._meta.get_field("quantity").column in columns
+
+        # Without the column each row is a single unit
+        units = Sum("quantity") if has_quantity else Count("id")
+        duplicates = (
+            OrderProduct.objects.values("order_id", "product_id")
+            .annotate(lines=Count("id"), keep=Min("id"), units=units)
+            .filter(lines__gt=1)
+            .order_by()
+        )
+
+        groups = list(duplicates.values_list("order_id", "product_id", "lines", "keep", "units"))
+        merged = len(groups)
+        removed = sum(group[2] - 1 for group in groups)
+
+        if not options["dry_run"]:
+            if has_quantity:
+                with transaction.atomic():
+                    self.remove_repeats(groups)
+                    self.set_units(groups)
+            else:
+                # The schema editor runs everything in one transaction. The
+                # repeats go first, SQLite rebuilds the table with the
+                # constraint when it adds the column
+                with connection.schema_editor() as editor:
+                    self.remove_repeats(groups)
+                    editor.add_field(OrderProduct, OrderProduct._meta.get_field("quantity"))
+                    self.set_units(groups)
+
+                    with connection.cursor() as cursor:
+                        existing = connection.introspection.get_constraints(cursor, table)
+                    for constraint in OrderProduct._meta.constraints:
+                        if constraint.name not in existing:
+                            editor.add_constraint(OrderProduct, constraint)
+
+        verb = "Would merge" if options["dry_run"] else "Merged"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {merged} products, {removed} line items removed"))
+
+    def remove_repeats(self, groups):
+        """Delete every line of each group but the kept one
+
+        Without signals, the units of completed orders stay sold.
+        """
+        for order_id, product_id, lines, keep, units in groups:
+            OrderProduct.objects.filter(
+                order_id=order_id, product_id=product_id
+            ).exclude(pk=keep)._raw_delete(connection.alias)
+
+    def set_units(self, groups):
+        """Give the kept line of each group the units of the whole group"""
+        for order_id, product_id, lines, keep, units in groups:
+            OrderProduct.objects.filter(pk=keep).update(quantity=units)
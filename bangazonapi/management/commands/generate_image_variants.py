@@ -0,0 +1,48 @@
+"""Create resized variants for product images that do not have them yet"""
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from bangazonapi.models import Product
+from bangazonapi.thumbnails import queue_variants, record_variants
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail and medium WebP/JPEG variants for existing product images"
+
+    def handle(self, *args, **options):
+        sources = (
+            Product.all_objects.exclude(image_path="")
+            .exclude(image_path__isnull=True)
+            .filter(image_variants={})
+            .values_list("image_path", flat=True)
+            .distinct()
+            .order_by()
+        )
+
+        jobs = []
+        done = 0
+        missing = 0
+        for source in list(sources):
+            if not default_storage.exists(source):
+                missing += 1
+                self.stderr.write(f"Skipping {source}, the file is missing")
+                continue
+
+            future = queue_variants(source)
+            if future is None:
+                done += 1
+            else:
+                jobs.append((source, future))
+
+        failed = 0
+        for source, future in jobs:
+            try:
+                # Record here too, the pool callback may not have run yet
+                record_variants(source, future.result())
+                done += 1
+            except Exception as ex:  # pylint: disable=broad-except
+                failed += 1
+                self.stderr.write(f"Could not create variants of {source}: {ex}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {done} images, {failed} failed, {missing} missing"
+        ))
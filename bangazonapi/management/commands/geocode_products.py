@@ -0,0 +1,56 @@
+"""Place every product on the map from the location gazetteer"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from bangazonapi.catalogcache import bump_catalog_version
+from bangazonapi.models import Location, Product
+
+
+COORDINATES = ("latitude", "longitude", "geohash")
+
+
+class Command(BaseCommand):
+    help = "Set latitude, longitude and geohash of products from their location names"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        places = Location.table()
+
+        products = Product.all_objects.only("id", "location", *COORDINATES).order_by("pk")
+
+        checked = 0
+        unknown = set()
+        changed = []
+        updated = 0
+        for product in products.iterator(chunk_size=batch_size):
+            checked += 1
+            before = tuple(getattr(product, field) for field in COORDINATES)
+
+            coordinates = places.get(product.location.strip().lower())
+            if coordinates is None:
+                unknown.add(product.location)
+            product.set_coordinates(coordinates)
+
+            if tuple(getattr(product, field) for field in COORDINATES) != before:
+                product.updated_at = timezone.now()
+                changed.append(product)
+
+            if len(changed) >= batch_size:
+                updated += self._save(changed)
+                changed = []
+
+        updated += self._save(changed)
+        if updated:
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} products, placed {updated}"))
+        if unknown:
+            self.stdout.write(f"Locations missing from the gazetteer: {', '.join(sorted(unknown))}")
+
+    def _save(self, products):
+        with transaction.atomic():
+            Product.all_objects.bulk_update(products, COORDINATES + ("updated_at",))
+        return len(products)
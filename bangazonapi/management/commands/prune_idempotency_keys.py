@@ -0,0 +1,11 @@
+"""Forget stored Idempotency-Key responses past their TTL"""
+from django.core.management.base import BaseCommand
+from bangazonapi import idempotency
+
+
+class Command(BaseCommand):
+    help = "Delete Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL, run it periodically"
+
+    def handle(self, *args, **options):
+        removed = idempotency.prune()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired idempotency keys"))
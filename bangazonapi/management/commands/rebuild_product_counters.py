@@ -0,0 +1,126 @@
+"""Rebuild the stored sales and rating counters on every product and category"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from bangazonapi.catalogcache import bump_catalog_version
+from bangazonapi.models import Product, ProductCategory, OrderProduct, ProductRating
+
+
+STARS = tuple(f"stars_{stars}" for stars in Product.RATING_STARS)
+COUNTERS = ("units_sold", "rating_count", "rating_sum") + STARS
+
+
+def _aggregate(queryset, expression):
+    """Correlated subquery for one per-product aggregate"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(product=OuterRef("pk"))
+            .values("product")
+            .annotate(value=expression)
+            .values("value"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute units sold and the rating summary of every product, "
+        "and the live product count of every category"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only report products whose counters are stale",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        sold = OrderProduct.objects.filter(order__payment_type__isnull=False)
+
+        products = (
+            Product.all_objects.only("id", "updated_at", *COUNTERS)
+            .annotate(
+                actual_units_sold=_aggregate(sold, Sum("quantity")),
+                actual_rating_count=_aggregate(ProductRating.objects, Count("id")),
+                actual_rating_sum=_aggregate(ProductRating.objects, Sum("rating")),
+                **{
+                    f"actual_stars_{stars}": _aggregate(
+                        ProductRating.objects.filter(rating=stars), Count("id"))
+                    for stars in Product.RATING_STARS
+                },
+            )
+            .order_by("pk")
+        )
+
+        checked = 0
+        stale = []
+        fixed = 0
+        for product in products.iterator(chunk_size=batch_size):
+            checked += 1
+            changed = False
+            for counter in COUNTERS:
+                actual = getattr(product, f"actual_{counter}")
+                if getattr(product, counter) != actual:
+                    setattr(product, counter, actual)
+                    changed = True
+
+            if changed:
+                product.updated_at = timezone.now()
+                stale.append(product)
+
+            if not options["verify"] and len(stale) >= batch_size:
+                fixed += self._save(stale)
+                stale = []
+
+        stale_categories = self._stale_categories()
+
+        if options["verify"]:
+            if stale:
+                ids = ", ".join(str(product.id) for product in stale[:20])
+                raise CommandError(
+                    f"{len(stale)} of {checked} products have stale counters (e.g. {ids})"
+                )
+            if stale_categories:
+                ids = ", ".join(str(category.id) for category in stale_categories[:20])
+                raise CommandError(
+                    f"{len(stale_categories)} categories have stale product counts (e.g. {ids})"
+                )
+            self.stdout.write(self.style.SUCCESS(f"All {checked} product counters are correct"))
+            return
+
+        fixed += self._save(stale)
+        with transaction.atomic():
+            ProductCategory.objects.bulk_update(
+                stale_categories, ("product_count", "updated_at"), batch_size=batch_size)
+        if fixed or stale_categories:
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} products, rebuilt {fixed} products "
+            f"and {len(stale_categories)} category counts"
+        ))
+
+    def _stale_categories(self):
+        """Categories whose stored product count is wrong, with the right one set"""
+        categories = ProductCategory.objects.annotate(
+            actual=Count("products", filter=Q(products__deleted__isnull=True))
+        ).only("id", "product_count", "updated_at")
+
+        stale = []
+        for category in categories:
+            if category.product_count != category.actual:
+                category.product_count = category.actual
+                category.updated_at = timezone.now()
+                stale.append(category)
+        return stale
+
+    def _save(self, products):
+        with transaction.atomic():
+            Product.all_objects.bulk_update(products, COUNTERS + ("updated_at",))
+        return len(products)
@@ -0,0 +1,18 @@
+"""Rebuild the full-text product search index"""
+from django.core.management.base import BaseCommand
+from bangazonapi import search
+
+
+class Command(BaseCommand):
+    help = "Repopulate the product full-text search index from live products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write("Full-text index is only used on SQLite, nothing to do")
+            return
+
+        indexed = search.rebuild_index(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products"))
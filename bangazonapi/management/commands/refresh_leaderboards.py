@@ -0,0 +1,21 @@
+"""Recompute the best seller leaderboards and drop expired sales buckets"""
+from django.core.management.base import BaseCommand
+from bangazonapi import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Rebuild the cached 1, 7 and 30 day leaderboards, run more often than LEADERBOARD_TTL"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-buckets", action="store_true",
+            help="Do not delete buckets that are older than every window",
+        )
+
+    def handle(self, *args, **options):
+        boards = leaderboard.refresh()
+        self.stdout.write(self.style.SUCCESS(f"Stored {boards} leaderboards"))
+
+        if not options["keep_buckets"]:
+            deleted = leaderboard.prune()
+            self.stdout.write(f"Deleted {deleted} expired sales buckets")
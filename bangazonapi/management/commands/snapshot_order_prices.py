@@ -0,0 +1,33 @@
+"""Store unit prices and totals on completed orders that predate price snapshots"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from bangazonapi.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy current product prices onto the line items of completed orders "
+        "without a total and store their totals, a batch of orders at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        pending = Order.objects.filter(
+            payment_type__isnull=False, total__isnull=True
+        ).order_by("pk")
+
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1]
+            # One short transaction per batch, so checkouts are not held up
+            with transaction.atomic():
+                updated += Order.objects.filter(pk__in=batch).snapshot_prices()
+
+        self.stdout.write(self.style.SUCCESS(f"Stored totals of {updated} orders"))
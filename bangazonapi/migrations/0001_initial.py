@@ -0,0 +1,255 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:31
+
+import bangazonapi.models.productsearch
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(db_index=True, editable=False, null=True)),
+                ('deleted_by_cascade', models.BooleanField(default=False, editable=False)),
+                ('name', models.CharField(max_length=50)),
+                ('price', models.FloatField(validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(10000.0)])),
+                ('description', models.CharField(max_length=255)),
+                ('quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('created_date', models.DateField(auto_now_add=True)),
+                ('location', models.CharField(max_length=50)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('geohash', models.CharField(blank=True, db_index=True, max_length=12, null=True)),
+                ('image_path', models.ImageField(null=True, upload_to='products')),
+                ('image_variants', models.JSONField(blank=True, default=dict)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('stars_0', models.IntegerField(default=0)),
+                ('stars_1', models.IntegerField(default=0)),
+                ('stars_2', models.IntegerField(default=0)),
+                ('stars_3', models.IntegerField(default=0)),
+                ('stars_4', models.IntegerField(default=0)),
+                ('stars_5', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'product',
+                'verbose_name_plural': 'products',
+            },
+        ),
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=15)),
+                ('address', models.CharField(max_length=55)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'location',
+                'verbose_name_plural': 'locations',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductCategory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=55)),
+                ('product_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'productcategory',
+                'verbose_name_plural': 'productcategories',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSearch',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='bangazonapi.product')),
+                ('document', bangazonapi.models.productsearch.FullTextField(db_column='bangazonapi_product_fts')),
+            ],
+            options={
+                'db_table': 'bangazonapi_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='products', to='bangazonapi.customer'),
+        ),
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.customer')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='favorited_seller', to='bangazonapi.customer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(db_index=True, editable=False, null=True)),
+                ('deleted_by_cascade', models.BooleanField(default=False, editable=False)),
+                ('merchant_name', models.CharField(max_length=25)),
+                ('account_number', models.CharField(max_length=25)),
+                ('create_date', models.DateField(default='0000-00-00')),
+                ('expiration_date', models.DateField(default='0000-00-00')),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='payment_types', to='bangazonapi.customer')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateField(default='0000-00-00')),
+                ('total', models.FloatField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.customer')),
+                ('payment_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.payment')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='products', to='bangazonapi.productcategory'),
+        ),
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(5)])),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bangazonapi.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='bangazonapi.product')),
+            ],
+            options={
+                'verbose_name': 'productrating',
+                'verbose_name_plural': 'productratings',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('units', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_buckets', to='bangazonapi.product')),
+            ],
+            options={
+                'verbose_name': 'productsalesbucket',
+                'verbose_name_plural': 'productsalesbuckets',
+            },
+        ),
+        migrations.CreateModel(
+            name='Rating',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(5)])),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.product')),
+            ],
+            options={
+                'verbose_name': 'rating',
+                'verbose_name_plural': 'ratings',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='customer', to='bangazonapi.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.product')),
+                ('recommender', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='recommender', to='bangazonapi.customer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Store',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('description', models.CharField(max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bangazonapi.customer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('body', models.JSONField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'idempotencykey',
+                'verbose_name_plural': 'idempotencykeys',
+                'indexes': [models.Index(fields=['created_at'], name='bangazonapi_created_255c98_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'key'), name='one_response_per_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderProduct',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.FloatField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='lineitems', to='bangazonapi.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='lineitems', to='bangazonapi.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='one_line_per_product')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'payment_type', 'created_date'], name='bangazonapi_custome_0c7b31_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_type__isnull', True)), fields=('customer',), name='one_open_order_per_customer'),
+        ),
+        migrations.AddConstraint(
+            model_name='productrating',
+            constraint=models.UniqueConstraint(fields=('product', 'customer'), name='one_rating_per_customer'),
+        ),
+        migrations.AddIndex(
+            model_name='productsalesbucket',
+            index=models.Index(fields=['granularity', 'start'], name='bangazonapi_granula_523ccf_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productsalesbucket',
+            constraint=models.UniqueConstraint(fields=('product', 'granularity', 'start'), name='one_bucket_per_period'),
+        ),
+    ]
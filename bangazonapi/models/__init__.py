@@ -1,5 +1,5 @@
 from .customer import Customer
-from .order import Order
+from .order import Order, OutOfStock
 from .orderproduct import OrderProduct
 from .payment import Payment
 from .product import Product
@@ -7,5 +7,9 @@ from .productcategory import ProductCategory
 from .recommendation import Recommendation
 from .rating import Rating
 from .favorite import Favorite
+from .idempotencykey import IdempotencyKey
+from .location import Location
 from .productrating import ProductRating
+from .productsalesbucket import ProductSalesBucket
+from .productsearch import ProductSearch
 from .store import Store
@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+
+class IdempotencyKey(models.Model):
+    """Response stored for an Idempotency-Key a client sent, see bangazonapi/idempotency.py"""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    # None while the first request with the key is still running
+    status_code = models.PositiveSmallIntegerField(null=True)
+    body = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = ("idempotencykey")
+        verbose_name_plural = ("idempotencykeys")
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="one_response_per_key"),
+        ]
+        indexes = [
+            models.Index(fields=["created_at"]),
+        ]
@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class Location(models.Model):
+    """Gazetteer entry mapping a place name to its coordinates"""
+
+    name = models.CharField(max_length=50, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    @classmethod
+    def lookup(cls, name):
+        """Coordinates of a place name, ignoring case
+
+        Returns:
+            tuple -- (latitude, longitude), or None for unknown places
+        """
+        if not name:
+            return None
+        return (
+            cls.objects.filter(name__iexact=name.strip())
+            .values_list("latitude", "longitude")
+            .first()
+        )
+
+    @classmethod
+    def table(cls):
+        """Every place keyed by lowercase name, for lookups without a query each
+
+        Returns:
+            dict -- Maps name to (latitude, longitude)
+        """
+        return {
+            name.lower(): (latitude, longitude)
+            for name, latitude, longitude in cls.objects.values_list(
+                "name", "latitude", "longitude")
+        }
+
+    class Meta:
+        verbose_name = ("location")
+        verbose_name_plural = ("locations")
@@ -1,10 +1,230 @@
 """Customer order model"""
-from django.db import models
+import random
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, models, transaction
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+from bangazonapi.catalogcache import bump_catalog_version
 from .customer import Customer
+from .orderproduct import OrderProduct
 from .payment import Payment
+from .product import Product
+from .productsalesbucket import ProductSalesBucket
+
+
+class OutOfStock(Exception):
+    """Raised when an order asks for more units than are in stock
+
+    Attributes:
+        shortages {list} -- product_id, requested and available for each
+            product that could not be reserved
+    """
+
+    def __init__(self, shortages):
+        super().__init__("Not enough stock to complete the order")
+        self.shortages = shortages
+
+
+def _open_order_key(customer_id):
+    return f"open-order:{customer_id}"
+
+
+class OrderQuerySet(models.QuerySet):
+    """Orders, with a shortcut to the open order that serves as a cart"""
+
+    def open_for(self, customer, create=False):
+        """Open order of a customer
+
+        The id of the open order is cached per customer, so the usual
+        lookup is a primary key hit. A stale id is harmless because the
+        order must still be open and belong to the customer to match.
+
+        Arguments:
+            customer {Customer} -- Owner of the cart
+            create {bool} -- Open a new order when the customer has none
+
+        Raises:
+            Order.DoesNotExist -- If there is no open order and create is False
+
+        Returns:
+            Order -- From this queryset, so annotations and prefetches apply
+        """
+        key = _open_order_key(customer.pk)
+        open_orders = self.filter(customer=customer, payment_type__isnull=True)
+
+        order_id = cache.get(key)
+        if order_id is not None:
+            order = open_orders.filter(pk=order_id).first()
+            if order is not None:
+                return order
+
+        order = open_orders.first()
+        if order is None:
+            if not create:
+                raise self.model.DoesNotExist("Customer has no open order")
+            try:
+                with transaction.atomic():
+                    created = self.model.objects.create(
+                        customer=customer, created_date=timezone.now().date())
+            except IntegrityError:
+                # A concurrent request opened it first, the unique index
+                # makes sure there is only that one
+                created = self.model.objects.get(
+                    customer=customer, payment_type__isnull=True)
+            order = open_orders.get(pk=created.pk)
+
+        cache.set(key, order.pk, settings.OPEN_ORDER_CACHE_TTL)
+        return order
+
+    def snapshot_prices(self):
+        """Copy product prices onto the line items of these orders and store their totals
+
+        Line items that already have a unit price keep it, so running
+        this again never reprices an order.
+
+        Returns:
+            int -- Number of orders given a total
+        """
+        order_ids = list(self.values_list("pk", flat=True))
+        if not order_ids:
+            return 0
+
+        lines = OrderProduct.objects.filter(order_id__in=order_ids)
+        lines.filter(unit_price__isnull=True).update(
+            unit_price=Subquery(
+                Product.all_objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+            )
+        )
+        totals = dict(
+            lines.values("order_id")
+            .annotate(total=Sum(F("unit_price") * F("quantity"), output_field=FloatField()))
+            .values_list("order_id", "total")
+            .order_by()
+        )
+
+        orders = [self.model(pk=pk, total=totals.get(pk) or 0.0) for pk in order_ids]
+        self.model.objects.bulk_update(orders, ["total"])
+        return len(orders)
 
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING,)
     payment_type = models.ForeignKey(Payment, on_delete=models.DO_NOTHING, null=True)
     created_date = models.DateField(default="0000-00-00",)
+    # Sum of unit price times quantity over the line items, set when the
+    # order is completed
+    total = models.FloatField(null=True, blank=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # A customer has at most one cart
+            models.UniqueConstraint(
+                fields=["customer"],
+                condition=Q(payment_type__isnull=True),
+                name="one_open_order_per_customer",
+            ),
+        ]
+        indexes = [
+            # Order history of a customer, filtered by payment and date
+            models.Index(fields=["customer", "payment_type", "created_date"]),
+        ]
+
+    def complete(self, payment_type):
+        """Close the order with a payment type
+
+        The first time an order is closed, the stock of its line items is
+        reserved, their prices and the order total are stored, and they are
+        rolled into the stored sales counter and the hourly and daily sales
+        buckets of each product, all in one transaction. Paying for an
+        already closed order only swaps the payment type.
+
+        A transaction that loses a lock conflict is retried up to
+        CHECKOUT_RETRIES times, unless it runs inside an outer transaction.
+
+        Arguments:
+            payment_type {Payment} -- Payment used for the order
+
+        Raises:
+            OutOfStock -- If a product does not have enough units left,
+                nothing is changed then
+        """
+        retries = settings.CHECKOUT_RETRIES
+        if transaction.get_connection().in_atomic_block:
+            retries = 0
+
+        for attempt in range(retries + 1):
+            try:
+                return self._complete(payment_type)
+            except OperationalError:
+                if attempt == retries:
+                    raise
+                # Back off a little more each time, with jitter so the
+                # losers of a conflict do not collide again
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+    def _complete(self, payment_type):
+        with transaction.atomic():
+            # A concurrent checkout of the same order waits here, then
+            # finds it closed below and only swaps the payment type. SQLite
+            # has no row locks, its write lock on the update does the same
+            Order.objects.select_for_update().only("pk").get(pk=self.pk)
+            closed = Order.objects.filter(
+                pk=self.pk, payment_type__isnull=True
+            ).update(payment_type=payment_type)
+            self.payment_type = payment_type
+
+            if not closed:
+                # Only the payment type, a stale instance must not write
+                # over the total stored by the first completion
+                self.save(update_fields=["payment_type"])
+                self.refresh_from_db(fields=["total"])
+                return
+
+            # Always in product order, so two orders never wait on each other
+            sold = (
+                self.lineitems.values("product_id")
+                .annotate(count=Sum("quantity"))
+                .order_by("product_id")
+            )
+
+            now = timezone.now()
+            shortages = []
+            for line in sold:
+                # Only takes the units if they are still there, no read first
+                reserved = Product.all_objects.filter(
+                    pk=line["product_id"], quantity__gte=line["count"]
+                ).update(
+                    quantity=F("quantity") - line["count"],
+                    units_sold=F("units_sold") + line["count"],
+                    updated_at=now,
+                )
+                if not reserved:
+                    shortages.append({
+                        "product_id": line["product_id"],
+                        "requested": line["count"],
+                    })
+                    continue
+                ProductSalesBucket.record(line["product_id"], line["count"], now)
+
+            if shortages:
+                available = dict(
+                    Product.all_objects.filter(
+                        pk__in=[shortage["product_id"] for shortage in shortages]
+                    ).values_list("pk", "quantity")
+                )
+                for shortage in shortages:
+                    shortage["available"] = available.get(shortage["product_id"], 0)
+                # Rolls back the order and every reservation made above
+                self.payment_type = None
+                raise OutOfStock(shortages)
+
+            Order.objects.filter(pk=self.pk).snapshot_prices()
+            self.refresh_from_db(fields=["total"])
+
+            bump_catalog_version()
+            transaction.on_commit(
+                lambda: cache.delete(_open_order_key(self.customer_id)))
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
 
 
 class OrderProduct(models.Model):
@@ -10,3 +11,86 @@ class OrderProduct(models.Model):
     product = models.ForeignKey("Product",
                                 on_delete=models.DO_NOTHING,
                                 related_name="lineitems")
+
+    quantity = models.PositiveIntegerField(default=1)
+    # Price of the product when the order was completed, None while open
+    unit_price = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["order", "product"], name="one_line_per_product"),
+        ]
+
+    @classmethod
+    def add(cls, order, product, quantity=1):
+        """Add units of a product to an order, growing its line if it has one
+
+        Returns:
+            OrderProduct -- The line holding the product
+        """
+        line = cls.objects.filter(order=order, product=product)
+        if not line.update(quantity=F("quantity") + quantity):
+            try:
+                with transaction.atomic():
+                    return cls.objects.create(order=order, product=product, quantity=quantity)
+            except IntegrityError:
+                # Another request added the line first
+                line.update(quantity=F("quantity") + quantity)
+        return line.get()
+
+    @classmethod
+    def add_many(cls, order, quantities, replace=False):
+        """Put many products in an order with a fixed number of queries
+
+        Lines the order already has are changed with one UPDATE, the rest
+        are inserted with one bulk_create, all in one transaction.
+
+        Arguments:
+            order {Order} -- Open order to change
+            quantities {dict} -- Maps product id to units
+            replace {bool} -- Set the units instead of adding to them, and
+                drop lines for products not in quantities
+        """
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    lines = cls.objects.filter(order=order)
+                    if replace:
+                        lines.exclude(product_id__in=quantities).delete()
+
+                    existing = set(
+                        lines.filter(product_id__in=quantities)
+                        .values_list("product_id", flat=True)
+                    )
+                    if existing:
+                        units = Case(
+                            *[When(product_id=product_id, then=Value(quantities[product_id]))
+                              for product_id in existing],
+                            output_field=models.PositiveIntegerField(),
+                        )
+                        lines.filter(product_id__in=existing).update(
+                            quantity=units if replace else F("quantity") + units)
+
+                    cls.objects.bulk_create([
+                        cls(order=order, product_id=product_id, quantity=quantity)
+                        for product_id, quantity in quantities.items()
+                        if product_id not in existing
+                    ])
+                return
+            except IntegrityError:
+                # A line was added by another request in between, the second
+                # attempt sees it and updates it instead
+                if attempt:
+                    raise
+
+    @classmethod
+    def remove(cls, order, product_id, quantity=1):
+        """Take units of a product off an order, dropping the line when none are left
+
+        Returns:
+            bool -- False if the order had no line for the product
+        """
+        line = cls.objects.filter(order=order, product_id=product_id)
+        if line.filter(quantity__gt=quantity).update(quantity=F("quantity") - quantity):
+            return True
+        return line.delete()[0] > 0
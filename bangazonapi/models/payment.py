@@ -11,3 +11,4 @@ class Payment(SafeDeleteModel):
     customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING, related_name="payment_types")
     create_date = models.DateField(default="0000-00-00",)
     expiration_date = models.DateField(default="0000-00-00",)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
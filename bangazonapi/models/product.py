@@ -2,15 +2,15 @@ from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE
+from bangazonapi import geo
 from .customer import Customer
 from .productcategory import ProductCategory
-from .orderproduct import OrderProduct
-from .productrating import ProductRating
 
 
 class Product(SafeDeleteModel):
 
     _safedelete_policy = SOFT_DELETE
+    RATING_STARS = range(6)
     name = models.CharField(max_length=50,)
     customer = models.ForeignKey(
         Customer, on_delete=models.DO_NOTHING, related_name='products')
@@ -22,9 +22,36 @@ class Product(SafeDeleteModel):
     category = models.ForeignKey(
         ProductCategory, on_delete=models.DO_NOTHING, related_name='products')
     location = models.CharField(max_length=50,)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=geo.PRECISION, null=True, blank=True, db_index=True)
     image_path = models.ImageField(
         upload_to='products', height_field=None,
         width_field=None, max_length=None, null=True)
+    image_variants = models.JSONField(default=dict, blank=True)
+    units_sold = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    # Number of ratings with each star value, see RATING_STARS
+    stars_0 = models.IntegerField(default=0)
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    def set_coordinates(self, coordinates):
+        """Place the product on the map, or take it off with None
+
+        Arguments:
+            coordinates {tuple} -- (latitude, longitude) or None
+        """
+        if coordinates is None:
+            self.latitude = self.longitude = self.geohash = None
+            return
+        self.latitude, self.longitude = coordinates
+        self.geohash = geo.encode(*coordinates)
 
     @property
     def number_sold(self):
@@ -33,9 +60,7 @@ class Product(SafeDeleteModel):
         Returns:
             int -- Number items on completed orders
         """
-        sold = OrderProduct.objects.filter(
-            product=self, order__payment_type__isnull=False)
-        return sold.count()
+        return self.units_sold
 
     @property
     def can_be_rated(self):
@@ -57,16 +82,20 @@ class Product(SafeDeleteModel):
         Returns:
             number -- The average rating for the product
         """
-        ratings = ProductRating.objects.filter(product=self)
-        total_rating = 0
-        for rating in ratings:
-            total_rating += rating.rating
-
         try:
-            avg = total_rating / len(ratings)
+            avg = self.rating_sum / self.rating_count
         except ZeroDivisionError:
             avg = 0
         return avg
+
+    @property
+    def rating_distribution(self):
+        """Histogram of ratings
+
+        Returns:
+            dict -- Number of ratings keyed by star value, "0" to "5"
+        """
+        return {str(stars): getattr(self, f"stars_{stars}") for stars in self.RATING_STARS}
         
     class Meta:
         verbose_name = ("product")
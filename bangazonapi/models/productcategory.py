@@ -4,6 +4,9 @@ from django.db import models
 class ProductCategory(models.Model):
 
     name = models.CharField(max_length=55)
+    # Live products, kept up to date by signals.py and the bulk importer
+    product_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     class Meta:
         verbose_name = ("productcategory")
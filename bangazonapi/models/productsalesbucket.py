@@ -0,0 +1,60 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+
+class ProductSalesBucket(models.Model):
+    """Units of a product sold within one hour or one day"""
+
+    HOUR = "hour"
+    DAY = "day"
+    GRANULARITIES = ((HOUR, "Hour"), (DAY, "Day"))
+
+    product = models.ForeignKey(
+        "Product", on_delete=models.CASCADE, related_name="sales_buckets")
+    granularity = models.CharField(max_length=4, choices=GRANULARITIES)
+    start = models.DateTimeField()
+    units = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = ("productsalesbucket")
+        verbose_name_plural = ("productsalesbuckets")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "granularity", "start"], name="one_bucket_per_period"),
+        ]
+        indexes = [
+            models.Index(fields=["granularity", "start"]),
+        ]
+
+    @staticmethod
+    def period_start(moment, granularity):
+        """Start of the hour or day a moment falls in"""
+        moment = moment.replace(minute=0, second=0, microsecond=0)
+        if granularity == ProductSalesBucket.DAY:
+            moment = moment.replace(hour=0)
+        return moment
+
+    @classmethod
+    def record(cls, product_id, units, moment):
+        """Add sold units to the hourly and daily buckets of a moment
+
+        Arguments:
+            product_id {int} -- Product that was sold
+            units {int} -- Number of units sold
+            moment {datetime} -- When the sale happened
+        """
+        for granularity, _ in cls.GRANULARITIES:
+            start = cls.period_start(moment, granularity)
+            bucket = cls.objects.filter(
+                product_id=product_id, granularity=granularity, start=start)
+
+            if bucket.update(units=F("units") + units):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        product_id=product_id, granularity=granularity,
+                        start=start, units=units)
+            except IntegrityError:
+                # Another order created the bucket first
+                bucket.update(units=F("units") + units)
@@ -0,0 +1,32 @@
+from django.db import models
+
+
+class FullTextField(models.TextField):
+    """Hidden FTS5 column named after its table, which takes MATCH queries"""
+
+
+@FullTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class ProductSearch(models.Model):
+    """Row of the full-text index over products, see bangazonapi/search.py
+
+    The FTS5 table is created by search.create_index() rather than by
+    migrations. The model only lets product queries join it.
+    """
+
+    product = models.OneToOneField(
+        "Product", on_delete=models.DO_NOTHING, primary_key=True,
+        db_column="rowid", db_constraint=False, related_name="search_entry")
+    document = FullTextField(db_column="bangazonapi_product_fts")
+
+    class Meta:
+        managed = False
+        db_table = "bangazonapi_product_fts"
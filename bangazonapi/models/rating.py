@@ -4,6 +4,7 @@ from .customer import Customer
 from .product import Product
 
 class Rating(models.Model):
+    """Legacy rating, superseded by ProductRating and no longer read or written"""
 
     customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING,)
     product = models.ForeignKey(Product, on_delete=models.DO_NOTHING,)
@@ -8,3 +8,4 @@ class Store(models.Model):
     name = models.CharField(max_length=50)
     description = models.CharField(max_length=255)
     seller = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
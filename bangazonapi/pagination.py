@@ -0,0 +1,163 @@
+"""Keyset pagination shared by the list endpoints"""
+import base64
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Opaque-cursor pagination that seeks past the last row of a page
+
+    The queryset ordering (for example from `order_by`/`direction`) is
+    kept and the primary key is appended as a tie breaker. The cursor
+    holds the sort values of the last row, so every page is a
+    `WHERE (sort, pk) > (...) LIMIT n` query no matter how deep it is.
+
+    Results stay a plain JSON array. The next page is advertised in a
+    `Link` header, and `?count=true` adds an `X-Total-Count` header
+    unless counting was turned off with `allow_count`.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    allow_count = True
+    ordering = ('pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, allow_count=None):
+        if allow_count is not None:
+            self.allow_count = allow_count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+
+        self.count = None
+        if self.allow_count and request.query_params.get(self.count_query_param) == 'true':
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(position))
+            except (TypeError, ValueError, DjangoValidationError):
+                # Well formed, but the values do not fit the sort fields
+                raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra row to find out if there is a following page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        self.next_position = None
+        if len(results) > self.page_size:
+            self.next_position = self._position(self.page[-1])
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_headers())
+
+    def get_headers(self):
+        """Link and X-Total-Count headers for the current page"""
+        headers = {}
+        next_link = self.get_next_link()
+        if next_link is not None:
+            headers['Link'] = f'<{next_link}>; rel="next"'
+        if self.count is not None:
+            headers['X-Total-Count'] = str(self.count)
+
+        return headers
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """Ordering of the queryset with the primary key as tie breaker
+
+        Raises:
+            ValidationError -- If a sort field is not a non-null column
+        """
+        ordering = list(queryset.query.order_by) or list(self.ordering)
+
+        self._fields = []
+        for order in ordering:
+            name = order.lstrip('-')
+            if name in queryset.query.annotations:
+                self._fields.append(name)
+                continue
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                field = None if name != 'pk' else queryset.model._meta.pk
+            if field is None or field.null:
+                raise ValidationError({'order_by': f'Cannot order by "{name}".'})
+            self._fields.append(field.attname)
+
+        if not {'pk', queryset.model._meta.pk.name} & {f.lstrip('-') for f in ordering}:
+            descending = ordering[0].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+            self._fields.append('pk')
+
+        return tuple(ordering)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def _position(self, instance):
+        return [getattr(instance, field) for field in self._fields]
+
+    def _after(self, position):
+        """Rows that sort after the given position
+
+        (a, b) > (x, y) is expanded to a > x OR (a = x AND b > y) so that
+        each branch can use an index on the sort columns.
+        """
+        condition = Q()
+        for index, order in enumerate(self.ordering):
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            branch = Q(**{f'{order.lstrip("-")}__{lookup}': position[index]})
+            for previous in range(index):
+                branch &= Q(**{self.ordering[previous].lstrip('-'): position[previous]})
+            condition |= branch
+
+        return condition
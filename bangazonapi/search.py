@@ -0,0 +1,133 @@
+"""Full-text product search backed by an SQLite FTS5 index
+
+The index is a separate virtual table keyed by product id, which
+product queries join through the unmanaged ProductSearch model. Model
+signals keep it in step with single writes and the rebuild_search_index
+command repopulates it in bulk. Other database backends fall back to
+case-insensitive substring matching.
+"""
+import re
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q, Value
+from bangazonapi.models import Product, ProductSearch
+
+TABLE = ProductSearch._meta.db_table
+
+# bm25 column weights for name, description and location
+WEIGHTS = (10.0, 2.0, 1.0)
+
+
+def is_supported():
+    """Whether the default database can host the FTS5 index"""
+    return connection.vendor == "sqlite"
+
+
+def create_index():
+    """Create the FTS5 table if it is missing"""
+    if not is_supported():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+            "USING fts5(name, description, location, tokenize='porter unicode61')"
+        )
+
+
+def index_products(products):
+    """Add or refresh index rows for the given products
+
+    Arguments:
+        products {iterable} -- Product instances with name, description and location
+    """
+    if not is_supported():
+        return
+
+    rows = [(p.pk, p.name, p.description, p.location) for p in products]
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, name, description, location) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_products(product_ids):
+    """Drop index rows for the given product ids"""
+    if not is_supported():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+
+def rebuild_index(batch_size=1000):
+    """Repopulate the whole index from live products
+
+    Returns:
+        int -- Number of products indexed
+    """
+    if not is_supported():
+        return 0
+
+    create_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+    indexed = 0
+    batch = []
+    products = Product.objects.only("id", "name", "description", "location").order_by("pk")
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            index_products(batch)
+            indexed += len(batch)
+            batch = []
+
+    index_products(batch)
+    return indexed + len(batch)
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query that requires every word as a prefix
+
+    Returns:
+        str -- FTS5 MATCH expression, empty if the query has no words
+    """
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_products(queryset, query):
+    """Restrict a product queryset to search matches
+
+    On SQLite the queryset is filtered on the FTS5 index in SQL, annotated
+    with `search_rank` (lower is a better match) and ordered by it, so
+    other filters and keyset pagination apply to every match. Elsewhere it
+    is filtered by substring.
+    """
+    if not is_supported():
+        words = re.findall(r"\w+", query)
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(description__icontains=word) | Q(location__icontains=word)
+            )
+        return queryset
+
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+
+    # Joins the index, which drives the query, and ranks every match once
+    rank = Func(
+        F("search_entry__document"), *(Value(weight) for weight in WEIGHTS),
+        function="bm25", output_field=FloatField(),
+    )
+    return (
+        queryset.filter(search_entry__document__match=expression)
+        .annotate(search_rank=rank)
+        .order_by("search_rank")
+    )
@@ -0,0 +1,176 @@
+"""Signal handlers that keep denormalized product data in step with writes"""
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+from bangazonapi import categories, search
+from bangazonapi.catalogcache import bump_catalog_version
+from bangazonapi.models import Location, Order, Product, ProductRating, OrderProduct, ProductCategory
+
+
+def adjust_rating_counters(product_id, rating, count):
+    """Add or remove one rating in the stored rating summary of a product
+
+    Arguments:
+        product_id {int} -- Product to update
+        rating {int} -- Star value of the rating
+        count {int} -- 1 to add the rating, -1 to remove it
+    """
+    stars = f"stars_{rating}"
+    Product.all_objects.filter(pk=product_id).update(
+        rating_count=F("rating_count") + count,
+        rating_sum=F("rating_sum") + count * rating,
+        **{stars: F(stars) + count},
+        updated_at=timezone.now(),
+    )
+
+
+def adjust_category_counts(counts):
+    """Shift the stored product counts of categories
+
+    Arguments:
+        counts {dict} -- Maps category id to the change in live products
+    """
+    now = timezone.now()
+    for category_id, count in counts.items():
+        if count:
+            ProductCategory.objects.filter(pk=category_id).update(
+                product_count=F("product_count") + count,
+                updated_at=now,
+            )
+
+
+@receiver(pre_save, sender=ProductRating)
+def remember_previous_rating(sender, instance, raw, **kwargs):
+    """Keep the stored rating so an edit can be applied as a delta"""
+    instance._previous_rating = None
+    if raw or instance.pk is None:
+        return
+
+    instance._previous_rating = (
+        ProductRating.objects.filter(pk=instance.pk)
+        .values_list("product_id", "rating")
+        .first()
+    )
+
+
+@receiver(post_save, sender=ProductRating)
+def rating_saved(sender, instance, created, raw, **kwargs):
+    """Add a new or edited rating to the product counters"""
+    if raw:
+        return
+
+    previous = getattr(instance, "_previous_rating", None)
+    if previous is not None:
+        adjust_rating_counters(previous[0], previous[1], -1)
+
+    adjust_rating_counters(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=ProductRating)
+def rating_deleted(sender, instance, **kwargs):
+    """Remove a deleted rating from the product counters"""
+    adjust_rating_counters(instance.product_id, instance.rating, -1)
+
+
+@receiver(post_delete, sender=OrderProduct)
+def line_item_deleted(sender, instance, **kwargs):
+    """Take the units of a deleted line item off the sales counter once sold
+
+    Line items of open orders were never counted. Completed orders lose
+    their line items this way before the order itself can be deleted.
+    """
+    sold = Order.objects.filter(pk=instance.order_id, payment_type__isnull=False).exists()
+    if sold:
+        Product.all_objects.filter(pk=instance.product_id).update(
+            units_sold=F("units_sold") - instance.quantity,
+            updated_at=timezone.now(),
+        )
+
+
+@receiver(pre_save, sender=Product)
+def locate_product(sender, instance, raw, update_fields, **kwargs):
+    """Look up the coordinates of the product location in the gazetteer"""
+    if raw or (update_fields is not None and "location" not in update_fields):
+        return
+    instance.set_coordinates(Location.lookup(instance.location))
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_listing(sender, instance, raw, **kwargs):
+    """Keep the stored category, if the product was live, to move its count"""
+    instance._previous_category = None
+    if raw or instance.pk is None:
+        return
+
+    stored = (
+        Product.all_objects.filter(pk=instance.pk)
+        .values_list("category_id", "deleted")
+        .first()
+    )
+    if stored is not None and stored[1] is None:
+        instance._previous_category = stored[0]
+
+
+@receiver(post_save, sender=Product)
+def count_listing(sender, instance, raw, **kwargs):
+    """Move the product between category counts on create, edit and (un)delete"""
+    if raw:
+        return
+
+    previous = getattr(instance, "_previous_category", None)
+    current = instance.category_id if instance.deleted is None else None
+    if previous != current:
+        counts = {}
+        if previous is not None:
+            counts[previous] = -1
+        if current is not None:
+            counts[current] = counts.get(current, 0) + 1
+        adjust_category_counts(counts)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw, **kwargs):
+    """Reindex a product, or drop it from search once soft deleted"""
+    if raw:
+        return
+
+    if instance.deleted:
+        search.remove_products([instance.pk])
+    else:
+        search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    """Drop a hard deleted product from search and its category count"""
+    search.remove_products([instance.pk])
+    if instance.deleted is None:
+        adjust_category_counts({instance.category_id: -1})
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def category_changed(sender, **kwargs):
+    """Drop the in-process category map"""
+    categories.invalidate()
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    """Create the full-text index table next to the app tables"""
+    if sender.name == "bangazonapi":
+        search.create_index()
+
+
+def catalog_changed(sender, **kwargs):
+    """Invalidate cached catalog responses
+
+    Soft deletes and undeletes go through save(), so post_save covers them.
+    """
+    bump_catalog_version()
+
+
+for catalog_model in (Product, ProductRating, OrderProduct, ProductCategory):
+    post_save.connect(catalog_changed, sender=catalog_model)
+    post_delete.connect(catalog_changed, sender=catalog_model)
@@ -0,0 +1,142 @@
+"""Resized WebP/JPEG variants of product images
+
+Uploads queue variant generation on a process pool so the request does
+not wait for Pillow. When a job finishes, every product using that
+source image gets the variant names in `Product.image_variants`, and
+the serializer exposes them as URLs from then on.
+
+Set IMAGE_VARIANT_WORKERS to 0 to render inline, for example in tests.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = "products/variants"
+
+# Longest edge in pixels for each variant
+SIZES = {
+    "thumbnail": 200,
+    "medium": 600,
+}
+
+# Pillow format name and file extension for each output
+FORMATS = {
+    "webp": "webp",
+    "jpeg": "jpg",
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_names(source_name):
+    """Storage names of every variant of a source image
+
+    Returns:
+        dict -- Maps "<size>_<format>" to a storage name
+    """
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return {
+        f"{size}_{image_format}": f"{VARIANT_DIR}/{stem}-{size}.{extension}"
+        for size in SIZES
+        for image_format, extension in FORMATS.items()
+    }
+
+
+def render_variants(source_path, media_root, names):
+    """Write resized copies of an image, runs inside a pool worker
+
+    Arguments:
+        source_path {str} -- Absolute path of the source image
+        media_root {str} -- Directory storage names are relative to
+        names {dict} -- Result of variant_names() for the source
+
+    Returns:
+        dict -- The names that were written
+    """
+    # pylint: disable=import-outside-toplevel
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        for size, longest_edge in SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((longest_edge, longest_edge))
+
+            for image_format in FORMATS:
+                path = os.path.join(media_root, names[f"{size}_{image_format}"])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                output = resized.convert("RGB") if image_format == "jpeg" else resized
+                output.save(path, image_format.upper(), quality=82)
+
+    return names
+
+
+def _get_executor():
+    global _executor  # pylint: disable=global-statement
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def record_variants(source_name, names):
+    """Point every product using a source image at its variants
+
+    The products count as changed, so ETags and cached responses move on.
+    """
+    # pylint: disable=import-outside-toplevel
+    from bangazonapi.catalogcache import bump_catalog_version
+    from bangazonapi.models import Product
+
+    Product.all_objects.filter(image_path=source_name).update(
+        image_variants=names, updated_at=timezone.now())
+    bump_catalog_version()
+
+
+def _job_done(source_name, future):
+    close_old_connections()
+    try:
+        record_variants(source_name, future.result())
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Could not create variants of %s", source_name)
+    finally:
+        close_old_connections()
+
+
+def queue_variants(source_name):
+    """Generate the variants of a stored image off the request path
+
+    Arguments:
+        source_name {str} -- Storage name of the source image
+
+    Returns:
+        Future -- Pool job, or None when the variants were made inline
+    """
+    names = variant_names(source_name)
+    if all(default_storage.exists(name) for name in names.values()):
+        record_variants(source_name, names)
+        return None
+
+    arguments = (default_storage.path(source_name), default_storage.path(""), names)
+    if not settings.IMAGE_VARIANT_WORKERS:
+        record_variants(source_name, render_variants(*arguments))
+        return None
+
+    future = _get_executor().submit(render_variants, *arguments)
+    future.add_done_callback(lambda done: _job_done(source_name, done))
+    return future
@@ -1,11 +1,59 @@
 """View module for handling requests about customer shopping cart"""
-import datetime
+from django.conf import settings
+from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from bangazonapi.models import Order, Customer, Product, OrderProduct
 from .product import ProductSerializer
-from .order import OrderSerializer
+from .order import OrderSerializer, orders_with_lines
+
+
+def requested_quantity(data):
+    """Units asked for in an add to cart request, 1 when not given
+
+    Raises:
+        ValueError -- If quantity is not a positive whole number
+    """
+    try:
+        quantity = int(data.get("quantity", 1))
+    except (TypeError, ValueError):
+        raise ValueError("quantity must be a whole number")
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+    return quantity
+
+
+def requested_items(data, allow_empty=False):
+    """Units per product asked for in a batch cart request
+
+    Repeated products are added up.
+
+    Arguments:
+        data {list} -- Items of the request body
+        allow_empty {bool} -- Accept an empty list, to empty the cart
+
+    Raises:
+        ValueError -- With a message for the client when the batch is invalid
+
+    Returns:
+        dict -- Maps product id to units
+    """
+    if not isinstance(data, list) or not (data or allow_empty):
+        raise ValueError("Expected a list of items")
+    if len(data) > settings.CART_BATCH_MAX:
+        raise ValueError(f"At most {settings.CART_BATCH_MAX} items per request")
+
+    quantities = {}
+    for item in data:
+        if not isinstance(item, dict):
+            raise ValueError("Each item must be an object")
+        try:
+            product_id = int(item["product_id"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("product_id is required")
+        quantities[product_id] = quantities.get(product_id, 0) + requested_quantity(item)
+    return quantities
 
 
 class Cart(ViewSet):
@@ -20,22 +68,20 @@ class Cart(ViewSet):
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         @apiParam {Number} product_id Id of product to add
+        @apiParam {Number} [quantity] Units to add, 1 by default. Adds to the
+            line already in the cart for the product
         """
+        try:
+            quantity = requested_quantity(request.data)
+        except ValueError as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
         current_user = Customer.objects.get(user=request.auth.user)
 
-        try:
-            open_order = Order.objects.get(
-                customer=current_user, payment_type__isnull=True)
-        except Order.DoesNotExist as ex:
-            open_order = Order()
-            open_order.created_date = datetime.datetime.now()
-            open_order.customer = current_user
-            open_order.save()
+        open_order = Order.objects.open_for(current_user, create=True)
 
-        line_item = OrderProduct()
-        line_item.product = Product.objects.get(pk=request.data["product_id"])
-        line_item.order = open_order
-        line_item.save()
+        product = Product.objects.get(pk=request.data["product_id"])
+        OrderProduct.add(open_order, product, quantity)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -46,19 +92,16 @@ class Cart(ViewSet):
         @apiName RemoveLineItem
         @apiGroup ShoppingCart
 
-        @apiParam {id} id Product Id to remove from cart
+        @apiParam {id} id Product Id to remove one unit of from cart
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         """
         current_user = Customer.objects.get(user=request.auth.user)
-        open_order = Order.objects.get(
-            customer=current_user, payment_type=None)
+        open_order = Order.objects.open_for(current_user)
 
-        line_item = OrderProduct.objects.filter(
-            product__id=pk,
-            order=open_order
-        )[0]
-        line_item.delete()
+        if not OrderProduct.remove(open_order, pk):
+            return Response({'message': 'Item not found in cart'},
+                            status=status.HTTP_404_NOT_FOUND)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -109,25 +152,81 @@ class Cart(ViewSet):
         """
         current_user = Customer.objects.get(user=request.auth.user)
         try:
-            open_order = Order.objects.get(
-                customer=current_user, payment_type=None)
+            return Response(self._cart(request, current_user))
+        except Order.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
-            products_on_order = Product.objects.filter(
-                lineitems__order=open_order)
+    @action(methods=['post', 'put'], detail=False)
+    def batch(self, request):
+        """
+        @api {POST} /cart/batch POST many products to cart at once
+        @apiName AddLineItems
+        @apiGroup ShoppingCart
 
-            serialized_order = OrderSerializer(
-                open_order, many=False, context={'request': request})
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {Object[]} body Products to add
+        @apiParam {Number} body.product_id Id of product to add
+        @apiParam {Number} [body.quantity] Units to add, 1 by default
+        @apiParamExample {json} Input
+            [
+                { "product_id": 52, "quantity": 2 },
+                { "product_id": 14 }
+            ]
+
+        @apiSuccess (200) {Object} cart The cart afterwards, same as GET /cart
+        @apiError (400) {Number[]} not_found Ids of products that do not exist,
+            nothing is added then
+        """
+        replace = request.method == 'PUT'
+        if replace:
+            """
+            @api {PUT} /cart/batch PUT the exact contents of the cart
+            @apiName ReplaceCart
+            @apiGroup ShoppingCart
+
+            @apiParam {Object[]} body Every product the cart should hold, as for POST.
+                Products missing from the list are removed from the cart, so an
+                empty list empties it
+            @apiSuccess (200) {Object} cart The cart afterwards, same as GET /cart
+            """
 
-            product_list = ProductSerializer(
-                products_on_order, many=True, context={'request': request})
+        try:
+            quantities = requested_items(request.data, allow_empty=replace)
+        except ValueError as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
-            final = {
-                "order": serialized_order.data
-            }
-            final["order"]["products"] = product_list.data
-            final["order"]["size"] = len(products_on_order)
+        products = Product.objects.in_bulk(list(quantities))
+        missing = sorted(set(quantities) - set(products))
+        if missing:
+            return Response(
+                {'message': 'Some products do not exist', 'not_found': missing},
+                status=status.HTTP_400_BAD_REQUEST)
 
-        except Order.DoesNotExist as ex:
-            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+        current_user = Customer.objects.get(user=request.auth.user)
+        open_order = Order.objects.open_for(current_user, create=True)
+
+        OrderProduct.add_many(open_order, quantities, replace=replace)
+
+        return Response(self._cart(request, current_user))
+
+    def _cart(self, request, customer):
+        """Serialized open order of a customer, in a fixed number of queries"""
+        open_order = orders_with_lines().open_for(customer)
+
+        serialized_order = OrderSerializer(
+            open_order, many=False, context={'request': request})
+
+        # Products come from the prefetched line items, no extra query
+        products_on_order = [line.product for line in open_order.lineitems.all()]
+        product_list = ProductSerializer(
+            products_on_order, many=True, context={'request': request})
 
-        return Response(final["order"])
+        final = {
+            "order": serialized_order.data
+        }
+        final["order"]["products"] = product_list.data
+        final["order"]["size"] = open_order.line_count
+        return final["order"]
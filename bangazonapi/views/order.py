@@ -1,16 +1,82 @@
 """View module for handling requests about customer order"""
 
 import datetime
+from django.db.models import F, FloatField, Prefetch, Sum
+from django.db.models.functions import Coalesce
 from django.http import HttpResponseServerError
+from django.utils.dateparse import parse_date
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from rest_framework.decorators import action
-from bangazonapi.models import Order, Payment, Customer, Product, OrderProduct
+from rest_framework.exceptions import ValidationError
+from bangazonapi.idempotency import idempotent
+from bangazonapi.models import Order, OutOfStock, Payment, Customer, Product, OrderProduct
+from bangazonapi.pagination import KeysetPagination
 from .product import ProductSerializer
 
 
+def orders_with_lines(totals=True):
+    """Orders with line items and products prefetched, and totals summed in SQL
+
+    Serializing an order from this queryset takes the same number of
+    queries no matter how many line items it has.
+
+    Arguments:
+        totals {bool} -- Sum the live prices of the line items. Completed
+            orders store their total, so order history leaves this off and
+            does not join products
+
+    Returns:
+        QuerySet -- Orders annotated with line_total and line_count, the
+            number of units, when totals is set
+    """
+    orders = Order.objects.prefetch_related(
+        Prefetch(
+            "lineitems",
+            queryset=OrderProduct.objects.select_related("product").order_by("id"),
+        )
+    )
+    if not totals:
+        return orders
+
+    return orders.annotate(
+        line_total=Coalesce(
+            Sum(F("lineitems__product__price") * F("lineitems__quantity"),
+                output_field=FloatField()),
+            0.0,
+        ),
+        line_count=Coalesce(Sum("lineitems__quantity"), 0),
+    )
+
+
+def _date_param(request, name):
+    """Date from the query string, None when not given
+
+    Raises:
+        ValidationError -- If the value is not a YYYY-MM-DD date
+    """
+    value = request.query_params.get(name, None)
+    if value is None:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValidationError({name: "Expected a date as YYYY-MM-DD."})
+    return date
+
+
+def _out_of_stock(ex):
+    """409 response listing the products an order could not reserve"""
+    return Response(
+        {"message": str(ex), "shortages": ex.shortages},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
 class OrderLineItemSerializer(serializers.HyperlinkedModelSerializer):
     """JSON serializer for line items"""
 
@@ -21,7 +87,7 @@ class OrderLineItemSerializer(serializers.HyperlinkedModelSerializer):
         url = serializers.HyperlinkedIdentityField(
             view_name="lineitem", lookup_field="id"
         )
-        fields = ("id", "product")
+        fields = ("id", "product", "quantity", "unit_price")
         depth = 1
 
 
@@ -45,7 +111,15 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
         )
 
     def get_total(self, obj):
-        total = sum([li.product.price for li in obj.lineitems.all()])
+        if obj.total is not None:
+            total = obj.total
+        elif hasattr(obj, "line_total"):
+            total = obj.line_total
+        else:
+            total = sum([
+                (li.product.price if li.unit_price is None else li.unit_price) * li.quantity
+                for li in obj.lineitems.all()
+            ])
         return f"{total:.2f}"
 
 
@@ -80,7 +154,7 @@ class Orders(ViewSet):
         """
         try:
             customer = Customer.objects.get(user=request.auth.user)
-            order = Order.objects.get(pk=pk, customer=customer)
+            order = orders_with_lines(totals=False).get(pk=pk, customer=customer)
             serializer = OrderSerializer(order, context={"request": request})
             return Response(serializer.data)
 
@@ -95,6 +169,7 @@ class Orders(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @idempotent
     def update(self, request, pk=None):
         """
         @api {PUT} /order/:id PUT new payment for order
@@ -102,6 +177,8 @@ class Orders(ViewSet):
         @apiGroup Orders
 
         @apiHeader {String} Authorization Auth token
+        @apiHeader {String} [Idempotency-Key] Unique per checkout, a retry with the
+            same key gets the first response back with an Idempotent-Replayed header
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
@@ -114,12 +191,24 @@ class Orders(ViewSet):
 
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
+
+        @apiError (409) {Object[]} shortages Products without enough stock, the order stays open
+        @apiErrorExample {json} Out of stock
+            HTTP/1.1 409 Conflict
+            {
+                "message": "Not enough stock to complete the order",
+                "shortages": [
+                    { "product_id": 12, "requested": 3, "available": 1 }
+                ]
+            }
         """
         customer = Customer.objects.get(user=request.auth.user)
         order = Order.objects.get(pk=pk, customer=customer)
         payment_id = request.data["payment_type"]
-        order.payment_type = Payment.objects.get(pk=payment_id)
-        order.save()
+        try:
+            order.complete(Payment.objects.get(pk=payment_id))
+        except OutOfStock as ex:
+            return _out_of_stock(ex)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -134,6 +223,8 @@ class Orders(ViewSet):
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
         @apiParam {id} payment_id Query param to filter by payment used
+        @apiParam {String} start_date Query param for orders created on or after YYYY-MM-DD
+        @apiParam {String} end_date Query param for orders created on or before YYYY-MM-DD
 
         @apiSuccess (200) {Object[]} orders Array of order objects
         @apiSuccess (200) {id} orders.id Order id
@@ -155,18 +246,34 @@ class Orders(ViewSet):
         """
         customer = Customer.objects.get(user=request.auth.user)
 
-        orders = Order.objects.filter(customer=customer, payment_type__isnull=False)
+        orders = orders_with_lines(totals=False).filter(
+            customer=customer, payment_type__isnull=False)
         payment = self.request.query_params.get("payment_id", None)
         if payment is not None:
-            orders = orders.filter(payment__id=payment)
+            if not payment.isdigit():
+                raise ValidationError({"payment_id": "Expected a payment type id."})
+            orders = orders.filter(payment_type_id=payment)
 
-        json_orders = OrderSerializer(orders, many=True, context={"request": request})
+        start_date = _date_param(request, "start_date")
+        if start_date is not None:
+            orders = orders.filter(created_date__gte=start_date)
+        end_date = _date_param(request, "end_date")
+        if end_date is not None:
+            orders = orders.filter(created_date__lte=end_date)
 
-        return Response(json_orders.data)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        json_orders = OrderSerializer(page, many=True, context={"request": request})
+
+        return paginator.get_paginated_response(json_orders.data)
 
     @action(methods=["put"], detail=True)
+    @idempotent
     def complete(self, request, pk=None):
-        """Complete an order by adding a payment type"""
+        """Complete an order by adding a payment type
+
+        Honors an Idempotency-Key header like PUT /orders/:id.
+        """
         try:
             # Get the order
             order = Order.objects.get(pk=pk)
@@ -176,11 +283,12 @@ class Orders(ViewSet):
             payment_type = Payment.objects.get(pk=payment_type_id)
 
             # Complete the order by adding payment type
-            order.payment_type = payment_type
-            order.save()
+            order.complete(payment_type)
 
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
+        except OutOfStock as ex:
+            return _out_of_stock(ex)
         except Order.DoesNotExist:
             return Response(
                 {"message": "Order not found"}, status=status.HTTP_404_NOT_FOUND
@@ -7,6 +7,7 @@ from rest_framework import status
 from rest_framework.exceptions import NotFound
 
 from bangazonapi.models import Payment, Customer
+from bangazonapi.pagination import KeysetPagination
 
 
 class PaymentSerializer(serializers.HyperlinkedModelSerializer):
@@ -84,6 +85,8 @@ class Payments(ViewSet):
         customer = Customer.objects.get(user=request.auth.user)
         payment_types = Payment.objects.filter(customer=customer)
 
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(payment_types, request, view=self)
         serializer = PaymentSerializer(
-            payment_types, many=True, context={'request': request})
-        return Response(serializer.data)
+            page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
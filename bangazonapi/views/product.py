@@ -1,31 +1,211 @@
 """View module for handling requests about products"""
 from rest_framework.decorators import action
 from bangazonapi.models.recommendation import Recommendation
-import base64
-from django.core.files.base import ContentFile
-from django.http import HttpResponseServerError
+import hashlib
+import logging
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseServerError, StreamingHttpResponse
+from django.utils import timezone
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
-from bangazonapi.models import Product, Customer, ProductCategory
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.exceptions import ValidationError
+from bangazonapi import catalogcache, categories, geo, importer, leaderboard
+from bangazonapi.conditional import conditional, latest
+from bangazonapi.images import InvalidImage, store_base64_image, store_image
+from bangazonapi.models import Product, Customer, OrderProduct, ProductCategory, ProductRating
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.search import search_products
+from bangazonapi.thumbnails import queue_variants
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+
+logger = logging.getLogger(__name__)
+
+
+def _product_stamp(pk):
+    """Version of a single product response, None if it does not exist
+
+    The category is part of the response, so renaming it counts too.
+    """
+    product = (Product.objects.filter(pk=pk)
+               .values('pk', 'updated_at', 'category__updated_at').first())
+    if product is None:
+        return None
+    return product, latest(product['updated_at'], product['category__updated_at'])
+
+
+def _clean_patch(patch):
+    """Validate one bulk update patch
+
+    Returns:
+        tuple -- (product id, dict of fields to change)
+
+    Raises:
+        ValueError -- With a message for the client when the patch is invalid
+    """
+    if not isinstance(patch, dict):
+        raise ValueError('Patch must be an object')
+
+    try:
+        product_id = int(patch['id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('id is required')
+
+    fields = {}
+    if 'price' in patch:
+        try:
+            fields['price'] = float(patch['price'])
+        except (TypeError, ValueError):
+            raise ValueError('price must be a number')
+        if not 0 <= fields['price'] <= 10000:
+            raise ValueError('price must be between 0 and 10000')
+
+    if 'quantity' in patch:
+        try:
+            fields['quantity'] = int(patch['quantity'])
+        except (TypeError, ValueError):
+            raise ValueError('quantity must be a whole number')
+        if fields['quantity'] < 0:
+            raise ValueError('quantity cannot be negative')
+
+    if not fields:
+        raise ValueError('Nothing to change, send price and/or quantity')
+    return product_id, fields
+
+
+# Lower edges of the price ranges reported by Products.facets
+PRICE_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class ProductCategorySummarySerializer(serializers.ModelSerializer):
+    """JSON serializer for the category of an expanded product"""
+
+    class Meta:
+        model = ProductCategory
+        fields = ('id', 'name')
+
+
+class ProductSellerSerializer(serializers.ModelSerializer):
+    """JSON serializer for the seller of an expanded product"""
+    first_name = serializers.CharField(source='user.first_name')
+    last_name = serializers.CharField(source='user.last_name')
+
+    class Meta:
+        model = Customer
+        fields = ('id', 'first_name', 'last_name')
 
 
 class ProductSerializer(serializers.ModelSerializer):
-    """JSON serializer for products"""
+    """JSON serializer for products
+
+    Arguments:
+        fields {iterable} -- Only output these fields, all of them when None
+        expand {iterable} -- Nested objects to add, see EXPANDABLE
+    """
+    image_variants = serializers.SerializerMethodField()
+    # Only present on ?near= searches
+    distance = serializers.FloatField(read_only=True)
+
+    # Nested objects a client can opt into with ?expand=
+    EXPANDABLE = {
+        'category': ProductCategorySummarySerializer,
+        'customer': ProductSellerSerializer,
+    }
+
+    # Model columns read by output fields that are not columns themselves
+    COLUMNS = {
+        'number_sold': ('units_sold',),
+        'average_rating': ('rating_count', 'rating_sum'),
+        'rating_distribution': tuple(f'stars_{stars}' for stars in Product.RATING_STARS),
+        'can_be_rated': (),
+        'distance': (),
+    }
+
     class Meta:
         model = Product
         fields = ('id', 'name', 'price', 'number_sold', 'description',
                   'quantity', 'created_date', 'location', 'image_path',
-                  'average_rating', 'can_be_rated', )
-        depth = 1
+                  'image_variants', 'average_rating', 'rating_count',
+                  'rating_distribution', 'can_be_rated', 'distance', )
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in expand:
+            self.fields[name] = self.EXPANDABLE[name](read_only=True)
+
+    @classmethod
+    def options(cls, request):
+        """fields and expand keyword arguments from the query string
+
+        Raises:
+            ValidationError -- If an unknown field is asked for
+        """
+        def names(param, allowed):
+            value = request.query_params.get(param)
+            if value is None:
+                return None
+            chosen = [name.strip() for name in value.split(',') if name.strip()]
+            unknown = sorted(set(chosen) - set(allowed))
+            if unknown:
+                raise ValidationError({param: f'Unknown fields: {", ".join(unknown)}'})
+            return chosen
+
+        return {
+            'fields': names('fields', cls.Meta.fields),
+            'expand': names('expand', cls.EXPANDABLE) or (),
+        }
+
+    @classmethod
+    def queryset_for(cls, products, fields=None, expand=()):
+        """Load only the columns and relations the chosen output needs"""
+        if expand:
+            products = products.select_related(
+                *('customer__user' if name == 'customer' else name for name in expand))
+        if fields is None:
+            return products
+
+        columns = {'id', *expand}
+        for name in fields:
+            columns.update(cls.COLUMNS.get(name, (name,)))
+
+        # Keep the sort columns so keyset pagination can read the last row
+        for order in products.query.order_by:
+            name = order.lstrip('-')
+            if name not in products.query.annotations:
+                columns.add(name)
+
+        return products.only(*columns)
+
+    def get_image_variants(self, obj):
+        """URLs of resized copies of the image, empty until they are ready"""
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in obj.image_variants.items():
+            url = default_storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request else url
+        return urls
 
 
 class Products(ViewSet):
     """Request handlers for Products in the Bangazon Platform"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    # Query params handled by _filtered_products
+    FILTER_PARAMS = ('category', 'q', 'number_sold', 'near', 'radius_km')
 
     def create(self, request):
         """
@@ -43,6 +223,8 @@ class Products(ViewSet):
         @apiParam {Number} quantity Number of items to sell
         @apiParam {String} location City where product is located
         @apiParam {Number} category_id Category of product
+        @apiParam {File} [image] Product image, when sent as multipart/form-data
+        @apiParam {String} [image_path] Product image as a base64 data URI, when sent as JSON
         @apiParamExample {json} Input
             {
                 "name": "Kite",
@@ -62,7 +244,10 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants URLs of resized WebP/JPEG copies once generated
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
+        @apiSuccess (200) {Number} product.rating_count Number of customer ratings
+        @apiSuccess (200) {Object} product.rating_distribution Number of ratings for each star value, "0" to "5"
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
         @apiSuccessExample {json} Success
@@ -94,23 +279,36 @@ class Products(ViewSet):
         customer = Customer.objects.get(user=request.auth.user)
         new_product.customer = customer
 
-        product_category = ProductCategory.objects.get(pk=request.data["category_id"])
-        new_product.category = product_category
-
-        if "image_path" in request.data:
-            format, imgstr = request.data["image_path"].split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'{new_product.id}-{request.data["name"]}.{ext}')
+        try:
+            new_product.category_id = categories.category_id(request.data["category_id"])
+        except ProductCategory.DoesNotExist as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
-            new_product.image_path = data
+        try:
+            if "image" in request.FILES:
+                new_product.image_path = store_image(request.FILES["image"])
+            elif request.data.get("image_path"):
+                new_product.image_path = store_base64_image(request.data["image_path"])
+        except InvalidImage as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
         new_product.save()
 
+        if new_product.image_path:
+            try:
+                queue_variants(new_product.image_path.name)
+            except (OSError, ValueError):
+                # Only when rendering inline. The product keeps the image
+                # without variants, as when a pool job fails
+                logger.exception("Could not create variants of %s", new_product.image_path.name)
+            new_product.refresh_from_db(fields=['image_variants'])
+
         serializer = ProductSerializer(
             new_product, context={'request': request})
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @conditional(lambda view, request, pk=None: _product_stamp(pk))
     def retrieve(self, request, pk=None):
         """
         @api {GET} /products/:id GET product
@@ -118,6 +316,8 @@ class Products(ViewSet):
         @apiGroup Product
 
         @apiParam {id} id Product Id
+        @apiParam {String} [fields] Comma separated fields to return, e.g. "id,name,price"
+        @apiParam {String} [expand] Comma separated nested objects to add: category, customer
 
         @apiSuccess (200) {Object} product Created product
         @apiSuccess (200) {id} product.id Product Id
@@ -128,7 +328,10 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants URLs of resized WebP/JPEG copies once generated
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
+        @apiSuccess (200) {Number} product.rating_count Number of customer ratings
+        @apiSuccess (200) {Object} product.rating_distribution Number of ratings for each star value, "0" to "5"
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
         @apiSuccessExample {json} Success
@@ -150,10 +353,18 @@ class Products(ViewSet):
                 }
             }
         """
+        options = ProductSerializer.options(request)
+
+        def build():
+            products = ProductSerializer.queryset_for(Product.objects.all(), **options)
+            serializer = ProductSerializer(
+                products.get(pk=pk), context={'request': request}, **options)
+            return dict(serializer.data)
+
         try:
-            product = Product.objects.get(pk=pk)
-            serializer = ProductSerializer(product, context={'request': request})
-            return Response(serializer.data)
+            data, hit = catalogcache.fetch(
+                f'product:{request.build_absolute_uri()}', build)
+            return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
         except Product.DoesNotExist:
             return Response({'message': 'Product not found.'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as ex:
@@ -184,8 +395,10 @@ class Products(ViewSet):
         customer = Customer.objects.get(user=request.auth.user)
         product.customer = customer
 
-        product_category = ProductCategory.objects.get(pk=request.data["category_id"])
-        product.category = product_category
+        try:
+            product.category_id = categories.category_id(request.data["category_id"])
+        except ProductCategory.DoesNotExist as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
         product.save()
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
@@ -222,6 +435,22 @@ class Products(ViewSet):
         @apiName ListProducts
         @apiGroup Product
 
+        @apiParam {String} [q] Search text matched against name, description and location.
+            Every match is returned, best match first unless order_by is given
+        @apiParam {Number} [category] Only products in this category
+        @apiParam {String} [order_by] Product field to sort by
+        @apiParam {String} [direction] Set to "desc" to reverse the sort
+        @apiParam {Number} [number_sold] Minimum number of items sold
+        @apiParam {String} [near] "latitude,longitude" to find products around, nearest first
+        @apiParam {Number} [radius_km] Search radius for near, 50 by default
+        @apiParam {Number} [quantity] Return only the newest N products, unpaginated
+        @apiParam {Number} [page_size] Products per page
+        @apiParam {String} [cursor] Opaque cursor from the Link header
+        @apiParam {Boolean} [count] Set to "true" for an X-Total-Count header
+        @apiParam {String} [fields] Comma separated fields to return, e.g. "id,name,price"
+        @apiParam {String} [expand] Comma separated nested objects to add: category, customer
+
+        @apiHeader (Response) {String} Link URL of the next page, rel="next"
         @apiSuccess (200) {Object[]} products Array of products
         @apiSuccessExample {json} Success
             [
@@ -244,14 +473,21 @@ class Products(ViewSet):
                 }
             ]
         """
-        products = Product.objects.all()
+        (data, headers), hit = catalogcache.fetch(
+            f'products:{request.build_absolute_uri()}',
+            lambda: self._product_page(request))
+        headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        return Response(data, headers=headers)
+
+    def _product_page(self, request):
+        """Serialized page of products for list, with its response headers"""
+        options = ProductSerializer.options(request)
+        products = self._filtered_products(request)
 
-        # Support filtering by category and/or quantity
-        category = self.request.query_params.get('category', None)
+        # Support ordering and limiting to the newest products
         quantity = self.request.query_params.get('quantity', None)
         order = self.request.query_params.get('order_by', None)
         direction = self.request.query_params.get('direction', None)
-        number_sold = self.request.query_params.get('number_sold', None)
 
         if order is not None:
             order_filter = order
@@ -262,23 +498,527 @@ class Products(ViewSet):
 
             products = products.order_by(order_filter)
 
+        # Slicing must come last so the filters above stay in SQL
+        if quantity is not None:
+            products = products.order_by("-created_date")
+            products = ProductSerializer.queryset_for(products, **options)[:int(quantity)]
+
+            serializer = ProductSerializer(
+                products, many=True, context={'request': request}, **options)
+            return list(serializer.data), {}
+
+        products = ProductSerializer.queryset_for(products, **options)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductSerializer(
+            page, many=True, context={'request': request}, **options)
+        return list(serializer.data), paginator.get_headers()
+
+    @action(methods=['get'], detail=False)
+    def facets(self, request):
+        """
+        @api {GET} /products/facets GET product counts for the catalog sidebar
+        @apiName ProductFacets
+        @apiGroup Product
+
+        @apiParam {String} [q] Same as for GET /products
+        @apiParam {Number} [category] Same as for GET /products
+        @apiParam {Number} [number_sold] Same as for GET /products
+
+        @apiSuccess (200) {Number} count Number of matching products
+        @apiSuccess (200) {Object[]} categories Product count per category
+        @apiSuccess (200) {Object[]} prices Product count per price range, max is exclusive
+        @apiSuccess (200) {Object[]} locations Product count per location
+        @apiSuccessExample {json} Success
+            {
+                "count": 3,
+                "categories": [
+                    { "id": 6, "name": "Games/Toys", "count": 3 }
+                ],
+                "prices": [
+                    { "min": 0, "max": 10, "count": 1 },
+                    { "min": 10, "max": 25, "count": 2 },
+                    { "min": 5000, "max": null, "count": 0 }
+                ],
+                "locations": [
+                    { "location": "Pittsburgh", "count": 3 }
+                ]
+            }
+        """
+        ttl = settings.PRODUCT_FACETS_CACHE_TTL
+        params = sorted(
+            (name, request.query_params[name])
+            for name in self.FILTER_PARAMS if name in request.query_params)
+        cache_key = f'product-facets:{catalogcache.catalog_version()}:' + hashlib.sha1(
+            urlencode(params).encode('utf-8')).hexdigest()
+
+        if ttl:
+            facets = cache.get(cache_key)
+            if facets is not None:
+                return Response(facets)
+
+        # Group the matching products themselves. Filters such as
+        # number_sold join line items, which would count a product once
+        # per joined row. Facets do not depend on ordering either.
+        products = Product.objects.filter(
+            pk__in=self._filtered_products(request).order_by().values('pk'))
+
+        categories = (products
+                      .values('category_id', 'category__name')
+                      .annotate(count=Count('id'))
+                      .order_by('-count', 'category__name'))
+
+        edges = list(PRICE_BUCKETS) + [None]
+        counts = products.aggregate(
+            total=Count('id'),
+            **{
+                f'bucket_{index}': Count('id', filter=Q(price__gte=low, price__lt=high)
+                                         if high is not None else Q(price__gte=low))
+                for index, (low, high) in enumerate(zip(edges, edges[1:]))
+            })
+
+        locations = (products
+                     .values('location')
+                     .annotate(count=Count('id'))
+                     .order_by('-count', 'location'))
+
+        facets = {
+            'count': counts['total'],
+            'categories': [
+                {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+                for row in categories
+            ],
+            'prices': [
+                {'min': low, 'max': high, 'count': counts[f'bucket_{index}']}
+                for index, (low, high) in enumerate(zip(edges, edges[1:]))
+            ],
+            'locations': list(locations),
+        }
+
+        if ttl:
+            cache.set(cache_key, facets, ttl)
+
+        return Response(facets)
+
+    @action(methods=['get'], detail=False, url_path='leaderboard')
+    def top_sellers(self, request):
+        """
+        @api {GET} /products/leaderboard GET best sellers of the last days
+        @apiName ProductLeaderboard
+        @apiGroup Product
+
+        @apiParam {Number=1,7,30} [window] Days to count sales over, 7 by default
+        @apiParam {Number} [category] Only products in this category
+        @apiParam {Number} [limit] Number of products, 10 by default
+        @apiParam {String} [fields] Comma separated product fields to return
+        @apiParam {String} [expand] Comma separated nested product objects to add
+
+        @apiSuccess (200) {Object[]} leaders Best seller first
+        @apiSuccess (200) {Number} leaders.rank Position on the leaderboard
+        @apiSuccess (200) {Number} leaders.units Units sold within the window
+        @apiSuccess (200) {Object} leaders.product The product
+        @apiSuccessExample {json} Success
+            [
+                {
+                    "rank": 1,
+                    "units": 14,
+                    "product": { "id": 101, "name": "Kite", "price": 14.99 }
+                }
+            ]
+        """
+        try:
+            window = int(request.query_params.get('window', 7))
+            limit = int(request.query_params.get('limit', 10))
+            category = request.query_params.get('category', None)
+            category = int(category) if category is not None else None
+        except ValueError:
+            return Response({'message': 'window, limit and category must be numbers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if window not in leaderboard.WINDOWS:
+            return Response({'message': 'window must be 1, 7 or 30'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.LEADERBOARD_SIZE))
+        options = ProductSerializer.options(request)
+
+        ranking = leaderboard.top_sellers(window, category)[:limit]
+        products = ProductSerializer.queryset_for(
+            Product.objects.all(), **options).in_bulk([product_id for product_id, _ in ranking])
+
+        # Products deleted since the board was computed are left out
+        ranked = [(products[product_id], units) for product_id, units in ranking
+                  if product_id in products]
+        serializer = ProductSerializer(
+            [product for product, _ in ranked], many=True,
+            context={'request': request}, **options)
+
+        return Response([
+            {'rank': rank, 'units': units, 'product': data}
+            for rank, ((_, units), data) in enumerate(zip(ranked, serializer.data), start=1)
+        ])
+
+    @action(methods=['post'], detail=False, url_path='import')
+    def bulk_import(self, request):
+        """
+        @api {POST} /products/import POST many products from CSV or JSON Lines
+        @apiName ImportProducts
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiHeader {String} Content-Type text/csv, application/x-ndjson,
+            or multipart/form-data with a .csv or .jsonl "file"
+
+        @apiParam {Number} [batch_size] Rows per insert and transaction
+        @apiParamExample {text} CSV
+            name,price,description,quantity,location,category
+            Kite,14.99,It flies high,60,Pittsburgh,Games/Toys
+        @apiParamExample {text} JSON Lines
+            {"name": "Kite", "price": 14.99, "description": "It flies high",
+             "quantity": 60, "location": "Pittsburgh", "category_id": 6}
+
+        @apiSuccess (201) {Number} created Products imported
+        @apiSuccess (201) {Number} failed Rows skipped
+        @apiSuccess (201) {Object[]} errors Row number and reason for skipped rows
+        @apiSuccessExample {json} Success
+            {
+                "created": 9998,
+                "failed": 2,
+                "errors": [
+                    { "row": 17, "message": "price must be a number" },
+                    { "row": 803, "message": "Category 'Boats' does not exist" }
+                ]
+            }
+        """
+        customer = Customer.objects.get(user=request.auth.user)
+
+        try:
+            batch_size = int(request.query_params.get(
+                'batch_size', settings.PRODUCT_IMPORT_BATCH_SIZE))
+        except ValueError:
+            return Response({'message': 'batch_size must be a number'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        batch_size = max(1, min(batch_size, settings.PRODUCT_IMPORT_MAX_BATCH_SIZE))
+
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type == 'multipart/form-data':
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'message': 'Attach the catalog as "file"'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            lines = importer.decode_lines(upload)
+            is_csv = upload.name.lower().endswith('.csv')
+        elif content_type in importer.CSV_TYPES + importer.JSONL_TYPES:
+            # Read the body line by line instead of through request.data
+            lines = importer.decode_lines(request.stream or [])
+            is_csv = content_type in importer.CSV_TYPES
+        else:
+            return Response({'message': f'Unsupported content type "{content_type}"'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        rows = importer.read_csv(lines) if is_csv else importer.read_jsonl(lines)
+        report = importer.import_products(rows, customer, batch_size)
+
+        response_status = status.HTTP_201_CREATED
+        if not report.created and report.failed:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(report.as_dict(), status=response_status)
+
+    @action(methods=['patch'], detail=False, url_path='bulk')
+    def bulk_update(self, request):
+        """
+        @api {PATCH} /products/bulk PATCH price and quantity of many products
+        @apiName BulkUpdateProducts
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {Object[]} body Patches for products owned by the seller
+        @apiParam {Number} body.id Product Id
+        @apiParam {Number} [body.price] New price
+        @apiParam {Number} [body.quantity] New quantity
+        @apiParamExample {json} Input
+            [
+                { "id": 12, "price": 9.99 },
+                { "id": 13, "quantity": 0 },
+                { "id": 14, "price": 19.99, "quantity": 40 }
+            ]
+
+        @apiSuccess (200) {Number[]} updated Ids that were changed
+        @apiSuccess (200) {Number[]} not_found Ids that do not exist or belong to another seller
+        @apiSuccess (200) {Object[]} invalid Patches that were rejected
+        @apiSuccess (200) {Number} invalid.index Position of the patch in the body
+        @apiSuccess (200) {Number} invalid.id Product Id of the patch, null when missing
+        @apiSuccess (200) {String[]} invalid.errors Why the patch was rejected
+        @apiSuccessExample {json} Success
+            {
+                "updated": [12, 14],
+                "not_found": [],
+                "invalid": [
+                    { "index": 1, "id": 13, "errors": ["quantity cannot be negative"] }
+                ]
+            }
+        """
+        patches = request.data
+        if not isinstance(patches, list):
+            return Response({'message': 'Expected a list of patches'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(patches) > settings.PRODUCT_BULK_UPDATE_MAX:
+            return Response(
+                {'message': f'At most {settings.PRODUCT_BULK_UPDATE_MAX} patches per request'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        # By position, patches without an id would all share one key
+        invalid = []
+        changes = {}
+        for index, patch in enumerate(patches):
+            try:
+                product_id, fields = _clean_patch(patch)
+            except ValueError as ex:
+                invalid.append({
+                    'index': index,
+                    'id': patch.get('id') if isinstance(patch, dict) else None,
+                    'errors': [str(ex)],
+                })
+                continue
+            changes.setdefault(product_id, {}).update(fields)
+
+        customer = Customer.objects.get(user=request.auth.user)
+        owned = Product.objects.filter(pk__in=changes, customer=customer).in_bulk()
+
+        # Only write the columns a patch touched, so a price change cannot
+        # overwrite a concurrent change to the stock level
+        now = timezone.now()
+        groups = {}
+        for product_id, fields in changes.items():
+            product = owned.get(product_id)
+            if product is None:
+                continue
+            for field, value in fields.items():
+                setattr(product, field, value)
+            product.updated_at = now
+            groups.setdefault(tuple(sorted(fields)), []).append(product)
+
+        with transaction.atomic():
+            for fields, products in groups.items():
+                Product.objects.bulk_update(
+                    products, fields + ('updated_at',), batch_size=500)
+
+        if owned:
+            catalogcache.bump_catalog_version()
+
+        return Response({
+            'updated': sorted(owned),
+            'not_found': sorted(set(changes) - set(owned)),
+            'invalid': invalid,
+        })
+
+    @action(methods=['get'], detail=False)
+    def export(self, request):
+        """
+        @api {GET} /products/export GET the whole catalog as JSON Lines
+        @apiName ExportProducts
+        @apiGroup Product
+
+        @apiParam {Number} [category] Only products in this category
+        @apiParam {String} [q] Search text matched against name, description and location
+        @apiParam {Number} [number_sold] Minimum number of items sold
+        @apiParam {String} [fields] Comma separated fields to return, e.g. "id,name,price"
+        @apiParam {String} [expand] Comma separated nested objects to add: category, customer
+
+        @apiSuccess (200) {Object} product One product per line, in id order
+        @apiSuccessExample {text} Success
+            HTTP/1.1 200 OK
+            Content-Type: application/x-ndjson
+
+            {"id": 1, "name": "Kite", "price": 14.99}
+            {"id": 2, "name": "Yo-yo", "price": 3.5}
+        """
+        options = ProductSerializer.options(request)
+        products = self._filtered_products(request).order_by('pk')
+        products = ProductSerializer.queryset_for(products, **options)
+
+        response = StreamingHttpResponse(
+            self._export_lines(products, request, options),
+            content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="products.jsonl"'
+        return response
+
+    def _export_lines(self, products, request, options):
+        """Serialize products a chunk at a time so memory use stays flat"""
+        chunk_size = settings.PRODUCT_EXPORT_CHUNK_SIZE
+        encoder = DjangoJSONEncoder()
+
+        chunk = []
+        for product in products.iterator(chunk_size=chunk_size):
+            chunk.append(product)
+            if len(chunk) == chunk_size:
+                yield self._export_chunk(chunk, request, options, encoder)
+                chunk = []
+
+        if chunk:
+            yield self._export_chunk(chunk, request, options, encoder)
+
+    def _export_chunk(self, chunk, request, options, encoder):
+        serializer = ProductSerializer(
+            chunk, many=True, context={'request': request}, **options)
+        return ''.join(f'{encoder.encode(row)}\n' for row in serializer.data)
+
+    @action(methods=['get'], detail=False, url_path='cache-stats',
+            permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """
+        @api {GET} /products/cache-stats GET product response cache counters
+        @apiName ProductCacheStats
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token of a staff user
+
+        @apiSuccessExample {json} Success
+            {
+                "hits": 120,
+                "misses": 8,
+                "hit_rate": 0.9375,
+                "local_entries": 8,
+                "version": 42
+            }
+        """
+        return Response(catalogcache.stats())
+
+    def _filtered_products(self, request):
+        """Products matching the category, q and number_sold query params"""
+        products = Product.objects.all()
+
+        category = request.query_params.get('category', None)
+        number_sold = request.query_params.get('number_sold', None)
+        query = request.query_params.get('q', None)
+
         if category is not None:
             products = products.filter(category__id=category)
 
-        if quantity is not None:
-            products = products.order_by("-created_date")[:int(quantity)]
+        # Search results come back ordered by relevance
+        if query is not None:
+            products = search_products(products, query)
 
         if number_sold is not None:
-            def sold_filter(product):
-                if product.number_sold >= int(number_sold):
-                    return True
-                return False
+            try:
+                number_sold = int(number_sold)
+            except ValueError:
+                raise ValidationError({'number_sold': 'Expected a whole number.'})
+
+            # A subquery rather than a join with GROUP BY, which would also
+            # group the search rank
+            sold = (OrderProduct.objects
+                    .filter(product=OuterRef('pk'), order__payment_type__isnull=False)
+                    .values('product')
+                    .annotate(total=Sum('quantity'))
+                    .values('total'))
+            products = products.annotate(
+                sold_count=Coalesce(Subquery(sold), 0)
+            ).filter(sold_count__gte=number_sold)
+
+        near = request.query_params.get('near', None)
+        if near is not None:
+            products = self._near(products, near, request.query_params.get('radius_km', None))
+
+        return products
+
+    def _near(self, products, near, radius_km):
+        """Products within radius_km of a "lat,lng" point, nearest first
+
+        Candidates come from index range scans over the geohash cells
+        covering the circle, and only they get an exact distance.
+        """
+        try:
+            latitude, longitude = (float(part) for part in near.split(','))
+        except ValueError:
+            raise ValidationError({'near': 'Expected "latitude,longitude".'})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({'near': 'Coordinates are out of range.'})
+
+        try:
+            radius = float(radius_km or settings.PRODUCT_NEAR_RADIUS_KM)
+        except ValueError:
+            raise ValidationError({'radius_km': 'Expected a number.'})
+        if not 0 < radius <= settings.PRODUCT_NEAR_MAX_RADIUS_KM:
+            raise ValidationError({
+                'radius_km': f'Must be between 0 and {settings.PRODUCT_NEAR_MAX_RADIUS_KM}.'})
+
+        cells = Q()
+        for prefix in geo.covering_cells(latitude, longitude, radius):
+            cells |= Q(geohash__gte=prefix, geohash__lt=prefix + geo.PREFIX_END)
+
+        # A separate candidate query keeps the planner on the geohash
+        # index instead of the soft delete index of the outer query
+        candidates = Product.all_objects.filter(cells).values('pk')
+        return (
+            products.filter(pk__in=candidates)
+            .annotate(distance=geo.distance_km(latitude, longitude))
+            .filter(distance__lte=radius)
+            .order_by('distance')
+        )
+
+    @action(methods=['post'], detail=True)
+    def rate(self, request, pk=None):
+        """
+        @api {POST} /products/:id/rate POST a rating for a product
+        @apiName RateProduct
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {id} id Product Id to rate
+        @apiParam {Number} rating Whole number of stars from 0 to 5, replaces an earlier rating
+        @apiParamExample {json} Input
+            {
+                "rating": 4
+            }
+
+        @apiSuccess (201) {Number} average_rating New average rating of the product
+        @apiSuccess (201) {Number} rating_count Number of ratings
+        @apiSuccess (201) {Object} rating_distribution Number of ratings for each star value
+        @apiSuccessExample {json} Success
+            {
+                "id": 50,
+                "average_rating": 3.5,
+                "rating_count": 2,
+                "rating_distribution": { "0": 0, "1": 0, "2": 0, "3": 1, "4": 1, "5": 0 }
+            }
+        """
+        try:
+            rating = int(request.data["rating"])
+        except (KeyError, TypeError, ValueError):
+            return Response({'message': 'rating must be a whole number'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if rating not in Product.RATING_STARS:
+            return Response({'message': 'rating must be between 0 and 5'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        customer = Customer.objects.get(user=request.auth.user)
+
+        # The signals in signals.py update the summary in this transaction
+        with transaction.atomic():
+            try:
+                product = Product.objects.select_for_update().get(pk=pk)
+            except Product.DoesNotExist:
+                return Response({'message': 'Product not found.'},
+                                status=status.HTTP_404_NOT_FOUND)
 
-            products = list(filter(sold_filter, products))
+            _, created = ProductRating.objects.update_or_create(
+                product=product, customer=customer, defaults={'rating': rating})
 
+        fields = ('id', 'average_rating', 'rating_count', 'rating_distribution')
+        product = ProductSerializer.queryset_for(
+            Product.objects.all(), fields=fields).get(pk=product.pk)
         serializer = ProductSerializer(
-            products, many=True, context={'request': request})
-        return Response(serializer.data)
+            product, context={'request': request}, fields=fields)
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
     @action(methods=['post'], detail=True)
     def recommend(self, request, pk=None):
@@ -5,13 +5,31 @@
 """
 
 """View module for handling requests about product categories"""
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
 from django.http import HttpResponseServerError
+from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
-from bangazonapi.models import ProductCategory
+from bangazonapi import catalogcache
+from bangazonapi.conditional import conditional
+from bangazonapi.models import Product, ProductCategory
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from .product import ProductSerializer
+
+
+def _categories_stamp(view, request, pk=None):
+    """Version of the category list, or of one category when pk is given"""
+    categories = ProductCategory.objects.all()
+    if pk is not None:
+        categories = categories.filter(pk=pk)
+
+    stamp = categories.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return stamp, stamp['updated']
 
 
 class ProductCategorySerializer(serializers.HyperlinkedModelSerializer):
@@ -22,7 +40,7 @@ class ProductCategorySerializer(serializers.HyperlinkedModelSerializer):
             view_name='productcategory',
             lookup_field='id'
         )
-        fields = ('id', 'url', 'name')
+        fields = ('id', 'url', 'name', 'product_count')
 
 
 class ProductCategories(ViewSet):
@@ -43,6 +61,7 @@ class ProductCategories(ViewSet):
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @conditional(_categories_stamp)
     def retrieve(self, request, pk=None):
         """Handle GET requests for single category"""
         try:
@@ -52,15 +71,86 @@ class ProductCategories(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @conditional(_categories_stamp)
     def list(self, request):
         """Handle GET requests to ProductCategory resource"""
-        product_category = ProductCategory.objects.all()
+        def build():
+            product_category = ProductCategory.objects.all()
+
+            # Support filtering ProductCategorys by area id
+            # name = self.request.query_params.get('name', None)
+            # if name is not None:
+            #     ProductCategories = ProductCategories.filter(name=name)
+
+            serializer = ProductCategorySerializer(
+                product_category, many=True, context={'request': request})
+            return list(serializer.data)
+
+        data, hit = catalogcache.fetch(
+            f'categories:{request.build_absolute_uri()}', build)
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    @action(methods=['get'], detail=False)
+    def preview(self, request):
+        """
+        @api {GET} /productcategories/preview GET newest products of every category
+        @apiName PreviewProductCategories
+        @apiGroup ProductCategory
+
+        @apiParam {Number} [limit] Products per category, 4 by default
+        @apiParam {String} [fields] Comma separated product fields to return
+        @apiParam {String} [expand] Comma separated nested product objects to add
+
+        @apiSuccess (200) {Object[]} categories Categories in id order
+        @apiSuccess (200) {Number} categories.product_count Live products in the category
+        @apiSuccess (200) {Object[]} categories.products Newest products first
+        @apiSuccessExample {json} Success
+            [
+                {
+                    "id": 1,
+                    "name": "Tools",
+                    "product_count": 12,
+                    "products": [
+                        { "id": 140, "name": "Hammer", "price": 12.5 }
+                    ]
+                }
+            ]
+        """
+        try:
+            limit = int(request.query_params.get('limit', settings.CATEGORY_PREVIEW_SIZE))
+        except ValueError:
+            return Response({'message': 'limit must be a number'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.CATEGORY_PREVIEW_MAX_SIZE))
+        options = ProductSerializer.options(request)
+
+        def build():
+            # One query ranks the products inside each category
+            ranked = Product.objects.annotate(
+                category_rank=Window(
+                    RowNumber(),
+                    partition_by=F('category_id'),
+                    order_by=(F('created_date').desc(), F('id').desc()),
+                )
+            ).filter(category_rank__lte=limit).order_by('category_id', 'category_rank')
+            ranked = list(ProductSerializer.queryset_for(ranked, **options))
+
+            serialized = ProductSerializer(
+                ranked, many=True, context={'request': request}, **options).data
+            products = {}
+            for product, data in zip(ranked, serialized):
+                products.setdefault(product.category_id, []).append(data)
 
-        # Support filtering ProductCategorys by area id
-        # name = self.request.query_params.get('name', None)
-        # if name is not None:
-        #     ProductCategories = ProductCategories.filter(name=name)
+            return [
+                {
+                    'id': category.id,
+                    'name': category.name,
+                    'product_count': category.product_count,
+                    'products': products.get(category.id, []),
+                }
+                for category in ProductCategory.objects.order_by('id')
+            ]
 
-        serializer = ProductCategorySerializer(
-            product_category, many=True, context={'request': request})
-        return Response(serializer.data)
+        data, hit = catalogcache.fetch(
+            f'category-preview:{request.build_absolute_uri()}', build)
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
@@ -1,18 +1,53 @@
 """View module for handling requests about customer profiles"""
 
-import datetime
 from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
+from django.db.models import Count, Max
 from rest_framework import serializers, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
+from bangazonapi.conditional import conditional, latest
 from bangazonapi.models import Order, Customer, Product
 from bangazonapi.models import OrderProduct, Favorite
 from bangazonapi.models import Recommendation
+from bangazonapi.pagination import KeysetPagination
 from .product import ProductSerializer
-from .order import OrderSerializer
+from .cart import requested_quantity
+from .order import OrderSerializer, orders_with_lines
+
+
+def _profile_stamp(view, request):
+    """Version of the profile of the authenticated customer
+
+    Covers the customer, their payment types (soft deleted ones too) and
+    the recommendations they made, in one aggregate query.
+    """
+    if request.auth is None:
+        return None
+
+    stamp = (
+        Customer.objects.filter(user=request.auth.user)
+        .values("id", "updated_at")
+        .annotate(
+            payments=Count("payment_types", distinct=True),
+            payments_updated=Max("payment_types__updated_at"),
+            recommends=Count("recommender", distinct=True),
+            products_updated=Max("recommender__product__updated_at"),
+            customers_updated=Max("recommender__customer__updated_at"),
+        )
+        .first()
+    )
+    if stamp is None:
+        return None
+
+    return stamp, latest(
+        stamp["updated_at"],
+        stamp["payments_updated"],
+        stamp["products_updated"],
+        stamp["customers_updated"],
+    )
 
 
 class Profile(ViewSet):
@@ -20,6 +55,7 @@ class Profile(ViewSet):
 
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @conditional(_profile_stamp)
     def list(self, request):
         """
         @api {GET} /profile GET user profile info
@@ -117,7 +153,7 @@ class Profile(ViewSet):
             @apiError (404) {String} message  Not found message.
             """
             try:
-                open_order = Order.objects.get(customer=current_user, payment_type=None)
+                open_order = Order.objects.open_for(current_user)
                 line_items = OrderProduct.objects.filter(order=open_order)
                 line_items.delete()
                 open_order.delete()
@@ -181,27 +217,21 @@ class Profile(ViewSet):
             @apiError (404) {String} message  Not found message
             """
             try:
-                open_order = Order.objects.get(customer=current_user, payment_type=None)
-                line_items = OrderProduct.objects.filter(order=open_order)
+                open_order = orders_with_lines().open_for(current_user)
                 line_items_serialized = LineItemSerializer(
-                    line_items, many=True, context={"request": request}
+                    open_order.lineitems.all(), many=True, context={"request": request}
                 )
 
                 # Transform data structure to match frontend expectations
-                products = []
-                total = 0
-                for item in line_items_serialized.data:
-                    product = item["product"]
-                    products.append(product)
-                    total += float(product["price"])
+                products = [item["product"] for item in line_items_serialized.data]
 
                 cart = {}
                 cart["order"] = OrderSerializer(
                     open_order, many=False, context={"request": request}
                 ).data
                 cart["order"]["products"] = products
-                cart["order"]["total"] = total
-                cart["order"]["size"] = len(line_items_serialized.data)
+                cart["order"]["total"] = open_order.line_total
+                cart["order"]["size"] = open_order.line_count
 
             except Order.DoesNotExist as ex:
                 return Response(
@@ -220,8 +250,13 @@ class Profile(ViewSet):
             @apiHeaderExample {String} Authorization
                 Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
+            @apiParam {Number} product_id Id of product to add
+            @apiParam {Number} [quantity] Units to add, 1 by default. Adds to the
+                line already in the cart for the product
+
             @apiSuccess (200) {Object} line_item Line items in cart
             @apiSuccess (200) {Number} line_item.id Line item id
+            @apiSuccess (200) {Number} line_item.quantity Units of the product in cart
             @apiSuccess (200) {Object} line_item.product Product in cart
             @apiSuccess (200) {Object} line_item.order Open order for cart
             @apiSuccessExample {json} Success
@@ -252,18 +287,14 @@ class Profile(ViewSet):
             """
 
             try:
-                open_order = Order.objects.get(customer=current_user, payment_type=None)
-                print(open_order)
-            except Order.DoesNotExist as ex:
-                open_order = Order()
-                open_order.created_date = datetime.datetime.now()
-                open_order.customer = current_user
-                open_order.save()
+                quantity = requested_quantity(request.data)
+            except ValueError as ex:
+                return Response({"message": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+            open_order = Order.objects.open_for(current_user, create=True)
 
-            line_item = OrderProduct()
-            line_item.product = Product.objects.get(pk=request.data["product_id"])
-            line_item.order = open_order
-            line_item.save()
+            product = Product.objects.get(pk=request.data["product_id"])
+            line_item = OrderProduct.add(open_order, product, quantity)
 
             line_item_json = LineItemSerializer(
                 line_item, many=False, context={"request": request}
@@ -280,13 +311,9 @@ class Profile(ViewSet):
         current_user = Customer.objects.get(user=request.auth.user)
 
         try:
-            open_order = Order.objects.get(customer=current_user, payment_type=None)
-            line_item = OrderProduct.objects.filter(
-                product__id=product_id, order=open_order
-            ).first()
+            open_order = Order.objects.open_for(current_user)
 
-            if line_item:
-                line_item.delete()
+            if OrderProduct.remove(open_order, product_id):
                 return Response({}, status=status.HTTP_204_NO_CONTENT)
             else:
                 return Response(
@@ -350,10 +377,12 @@ class Profile(ViewSet):
         customer = Customer.objects.get(user=request.auth.user)
         favorites = Favorite.objects.filter(customer=customer)
 
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(favorites, request, view=self)
         serializer = FavoriteSerializer(
-            favorites, many=True, context={"request": request}
+            page, many=True, context={"request": request}
         )
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class LineItemSerializer(serializers.HyperlinkedModelSerializer):
@@ -367,7 +396,7 @@ class LineItemSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = OrderProduct
-        fields = ("id", "product")
+        fields = ("id", "product", "quantity")
         depth = 1
 
 
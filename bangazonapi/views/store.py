@@ -1,15 +1,33 @@
 """View module for handling requests about stores"""
 
+from django.db.models import Count, Max
 from django.http import HttpResponseServerError
 from rest_framework import serializers, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
+from bangazonapi.conditional import conditional, latest
 from bangazonapi.models import Store, Customer, Favorite
+from bangazonapi.pagination import KeysetPagination
 from .customer import CustomerSerializer
 
 
+def _stores_stamp(view, request, pk=None):
+    """Version of the store list, or of one store when pk is given"""
+    stores = Store.objects.all()
+    if pk is not None:
+        stores = stores.filter(pk=pk)
+
+    stamp = stores.aggregate(
+        count=Count("id"),
+        stores=Max("updated_at"),
+        sellers=Max("seller__updated_at"),
+    )
+    return stamp, latest(stamp["stores"], stamp["sellers"])
+
+
 class StoreSerializer(serializers.ModelSerializer):
     """JSON serializer for stores"""
 
@@ -41,6 +59,7 @@ class StoreViewSet(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @conditional(_stores_stamp)
     def retrieve(self, request, pk=None):
         """Handle GET requests for single store"""
         try:
@@ -77,14 +96,19 @@ class StoreViewSet(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @conditional(_stores_stamp)
     def list(self, request):
         """Handle GET requests for stores"""
         try:
             stores = Store.objects.all()
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(stores, request, view=self)
             serializer = StoreSerializer(
-                stores, many=True, context={"request": request}
+                page, many=True, context={"request": request}
             )
-            return Response(serializer.data)
+            return paginator.get_paginated_response(serializer.data)
+        except (NotFound, ValidationError):
+            raise
         except Exception as ex:
             return HttpResponseServerError(ex)
 
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from django.contrib.auth.models import User
+from bangazonapi.pagination import KeysetPagination
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -47,6 +48,8 @@ class Users(ViewSet):
     def list(self, request):
         """Handle GET requests to user resource"""
         users = User.objects.all()
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
         serializer = UserSerializer(
-            users, many=True, context={'request': request})
-        return Response(serializer.data)
\ No newline at end of file
+            page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
@@ -8,6 +8,7 @@ python manage.py loaddata users
 python manage.py loaddata tokens
 python manage.py loaddata customers
 python manage.py loaddata product_category
+python manage.py loaddata locations
 python manage.py loaddata product
 python manage.py loaddata productrating
 python manage.py loaddata payment
@@ -16,3 +17,7 @@ python manage.py loaddata order_product
 # python manage.py loaddata favoritesellers
 # python manage.py loaddata stores
 
+python manage.py rebuild_product_counters
+python manage.py snapshot_order_prices
+python manage.py rebuild_search_index
+python manage.py geocode_products
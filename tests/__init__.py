@@ -1,3 +1,3 @@
 from .product import ProductTests
-from .order import OrderTests
+from .order import OrderTests, OrderStockTests
 from .payments import PaymentTests
\ No newline at end of file
@@ -1,6 +1,18 @@
+import datetime
 import json
+import threading
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from bangazonapi.models import (
+    Customer, IdempotencyKey, Order, OrderProduct, OutOfStock, Payment, Product, ProductCategory,
+)
 
 
 class OrderTests(APITestCase):
@@ -177,3 +189,391 @@ class OrderTests(APITestCase):
         self.assertIn("/payment-types/1", closed_order["payment_type"])
 
     # TODO: The next Test HEHE :)
+
+    def test_completed_order_updates_number_sold(self):
+        """
+        Ensure completing an order rolls its line items into number_sold.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        self.client.post("/cart", {"product_id": 1}, format="json")
+
+        response = self.client.get("/cart", format="json")
+        order_id = json.loads(response.content)["id"]
+
+        # Paying twice must not count the items twice
+        url = f"/orders/{order_id}"
+        self.client.put(url, {"payment_type": 1}, format="json")
+        self.client.put(url, {"payment_type": 1}, format="json")
+
+        response = self.client.get("/products/1", format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["number_sold"], 2)
+
+        call_command("rebuild_product_counters", "--verify", stdout=StringIO())
+
+        # Deleting a sold line item takes its units back off the counter
+        OrderProduct.objects.filter(order_id=order_id).delete()
+        Order.objects.filter(pk=order_id).delete()
+        self.assertEqual(Product.objects.get(pk=1).units_sold, 0)
+        call_command("rebuild_product_counters", "--verify", stdout=StringIO())
+
+    def test_completed_order_ranks_on_leaderboard(self):
+        """
+        Ensure completed orders are counted on the best seller leaderboards.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        self.client.post("/cart", {"product_id": 1}, format="json")
+
+        response = self.client.get("/cart", format="json")
+        order_id = json.loads(response.content)["id"]
+        self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format="json")
+
+        call_command("refresh_leaderboards", stdout=StringIO())
+
+        for window in (1, 7, 30):
+            response = self.client.get(f"/products/leaderboard?window={window}&fields=id")
+            json_response = json.loads(response.content)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(json_response, [{"rank": 1, "units": 2, "product": {"id": 1}}])
+
+        response = self.client.get("/products/leaderboard?window=7&category=2")
+        self.assertEqual(json.loads(response.content), [])
+
+        response = self.client.get("/products/leaderboard?window=3")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_complete_order_reserves_stock(self):
+        """
+        Ensure completing an order takes its units from stock, or fails without changes.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        response = self.client.get("/cart", format="json")
+        order_id = json.loads(response.content)["id"]
+
+        Product.objects.filter(pk=1).update(quantity=1)
+        response = self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(json_response["shortages"],
+                         [{"product_id": 1, "requested": 2, "available": 1}])
+        self.assertEqual(Product.objects.get(pk=1).quantity, 1)
+        self.assertIsNone(Order.objects.get(pk=order_id).payment_type)
+
+        Product.objects.filter(pk=1).update(quantity=5)
+        response = self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Product.objects.get(pk=1).quantity, 3)
+
+    def test_cart_reads_use_constant_queries(self):
+        """
+        Ensure reading the cart costs the same number of queries for any cart size.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1}, format="json")
+
+        def read(url):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, format="json")
+            return json.loads(response.content), len(queries)
+
+        small_cart, small_queries = read("/cart")
+        small_profile, small_profile_queries = read("/profile/cart")
+
+        for product_id in range(2, 6):
+            data = {
+                "name": "Kite",
+                "price": 14.99,
+                "quantity": 60,
+                "description": "It flies high",
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            self.client.post("/products", data, format="json")
+            self.client.post("/cart", {"product_id": product_id, "quantity": 2}, format="json")
+
+        cart, queries = read("/cart")
+        self.assertEqual(queries, small_queries)
+        self.assertEqual(cart["size"], 9)
+        self.assertEqual(cart["total"], "134.91")
+        self.assertEqual(len(cart["products"]), 5)
+
+        profile, profile_queries = read("/profile/cart")
+        self.assertEqual(profile_queries, small_profile_queries)
+        self.assertEqual(profile["size"], 9)
+        self.assertAlmostEqual(profile["total"], 134.91)
+        self.assertEqual(small_profile["size"], 1)
+
+    def test_add_to_cart_grows_one_line(self):
+        """
+        Ensure adding a product again raises the quantity of its line item.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        self.client.post("/cart", {"product_id": 1, "quantity": 3}, format="json")
+        self.client.post("/profile/cart", {"product_id": 1}, format="json")
+
+        response = self.client.get("/cart", format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response["lineitems"]), 1)
+        self.assertEqual(json_response["lineitems"][0]["quantity"], 5)
+        self.assertEqual(json_response["size"], 5)
+        self.assertEqual(json_response["total"], "74.95")
+
+        # Removing takes off one unit at a time
+        self.client.delete("/cart/1", format="json")
+        self.client.delete("/profile/cart/1", format="json")
+        response = self.client.get("/cart", format="json")
+        self.assertEqual(json.loads(response.content)["size"], 3)
+
+        order_id = json_response["id"]
+        self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format="json")
+        response = self.client.get("/products/1", format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["number_sold"], 3)
+        self.assertEqual(json_response["quantity"], 57)
+
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 0}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_add_and_replace_cart(self):
+        """
+        Ensure many products can be added to or set as the cart in one request.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        data = {
+            "name": "Ball",
+            "price": 5.00,
+            "quantity": 10,
+            "description": "It bounces",
+            "category_id": 1,
+            "location": "Pittsburgh",
+        }
+        self.client.post("/products", data, format="json")
+        self.client.post("/cart", {"product_id": 1}, format="json")
+
+        items = [{"product_id": 1, "quantity": 2}, {"product_id": 2}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/cart/batch", items, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted((line["product"]["id"], line["quantity"]) for line in json_response["lineitems"]),
+            [(1, 3), (2, 1)])
+        self.assertEqual(json_response["size"], 4)
+        self.assertLess(len(queries), 15)
+
+        response = self.client.put("/cart/batch", [{"product_id": 2, "quantity": 5}], format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(
+            [(line["product"]["id"], line["quantity"]) for line in json_response["lineitems"]],
+            [(2, 5)])
+        self.assertEqual(json_response["total"], "25.00")
+
+        response = self.client.put("/cart/batch", [], format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["lineitems"], [])
+        self.assertEqual(json_response["size"], 0)
+        self.assertFalse(OrderProduct.objects.filter(order_id=json_response["id"]).exists())
+
+        response = self.client.post("/cart/batch", [], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post("/cart/batch", [{"product_id": 99}], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)["not_found"], [99])
+
+    def test_customer_has_one_open_order(self):
+        """
+        Ensure a customer never has more than one open order.
+        """
+        customer = Customer.objects.get(user__username="steve")
+        first = Order.objects.open_for(customer, create=True)
+        self.assertEqual(Order.objects.open_for(customer, create=True).pk, first.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Order.objects.open_for(customer).pk, first.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertIn(f'"id" = {first.pk}', queries[0]["sql"])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(customer=customer, created_date="2025-07-16")
+
+        first.complete(Payment.objects.get(pk=1))
+        second = Order.objects.open_for(customer, create=True)
+        self.assertNotEqual(second.pk, first.pk)
+
+    def test_list_order_history(self):
+        """
+        Ensure completed orders can be filtered by payment type and date.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        for _ in range(3):
+            self.client.post("/cart", {"product_id": 1, "quantity": 2}, format="json")
+            order_id = json.loads(self.client.get("/cart").content)["id"]
+            self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format="json")
+        today = timezone.now().date()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/orders", {"payment_id": 1})
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json_response), 3)
+        self.assertEqual(json_response[0]["total"], "29.98")
+        self.assertLess(len(queries), 10)
+
+        response = self.client.get("/orders", {"payment_id": 2})
+        self.assertEqual(json.loads(response.content), [])
+
+        response = self.client.get("/orders", {"start_date": today.isoformat(), "end_date": today.isoformat()})
+        self.assertEqual(len(json.loads(response.content)), 3)
+        tomorrow = today + datetime.timedelta(days=1)
+        response = self.client.get("/orders", {"start_date": tomorrow.isoformat()})
+        self.assertEqual(json.loads(response.content), [])
+
+        response = self.client.get("/orders", {"end_date": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_completed_order_keeps_its_prices(self):
+        """
+        Ensure an order total does not change when the seller reprices a product.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format="json")
+        order_id = json.loads(self.client.get("/cart").content)["id"]
+        self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format="json")
+        Product.objects.filter(pk=1).update(price=20.00)
+
+        response = self.client.get(f"/orders/{order_id}")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["total"], "29.98")
+        self.assertEqual(json_response["lineitems"][0]["unit_price"], 14.99)
+
+        # Orders completed before prices were stored are backfilled
+        Order.objects.filter(pk=order_id).update(total=None)
+        OrderProduct.objects.filter(order_id=order_id).update(unit_price=None)
+        call_command("snapshot_order_prices", "--batch-size", "1", stdout=StringIO())
+        self.assertEqual(Order.objects.get(pk=order_id).total, 40.0)
+
+    def test_second_completion_keeps_order_total(self):
+        """
+        Ensure completing an order again from a stale instance keeps its total.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format="json")
+        order_id = json.loads(self.client.get("/cart").content)["id"]
+
+        first = Order.objects.get(pk=order_id)
+        second = Order.objects.get(pk=order_id)
+        first.complete(Payment.objects.get(pk=1))
+        second.complete(Payment.objects.get(pk=1))
+
+        self.assertAlmostEqual(second.total, 29.98)
+        self.assertAlmostEqual(Order.objects.get(pk=order_id).total, 29.98)
+        self.assertEqual(Product.objects.get(pk=1).quantity, 58)
+
+    def test_checkout_retry_with_idempotency_key_is_replayed(self):
+        """
+        Ensure a retried checkout with the same Idempotency-Key does not run twice.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format="json")
+        order_id = json.loads(self.client.get("/cart").content)["id"]
+        url = f"/orders/{order_id}/complete"
+
+        response = self.client.put(
+            url, {"paymentTypeId": 1}, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn("Idempotent-Replayed", response)
+
+        # Reopen the order so a second run would reserve stock again
+        Order.objects.filter(pk=order_id).update(payment_type=None)
+        response = self.client.put(
+            url, {"paymentTypeId": 1}, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        self.assertEqual(Product.objects.get(pk=1).quantity, 58)
+
+        response = self.client.put(
+            url, {"paymentTypeId": 2}, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1")
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        IdempotencyKey.objects.filter(key="checkout-1").update(status_code=None)
+        response = self.client.put(
+            url, {"paymentTypeId": 1}, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # A claim whose worker died is taken over once its lease runs out
+        IdempotencyKey.objects.filter(key="checkout-1").update(
+            created_at=timezone.now() - datetime.timedelta(minutes=5))
+        response = self.client.put(
+            url, {"paymentTypeId": 1}, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(IdempotencyKey.objects.get(key="checkout-1").status_code, 204)
+
+
+class OrderStockTests(TransactionTestCase):
+    """Checkout under concurrent load, each thread with its own connection"""
+
+    THREADS = 12
+    STOCK = 5
+
+    def setUp(self) -> None:
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        self.product = Product.objects.create(
+            name="Kite", price=14.99, description="It flies high", quantity=self.STOCK,
+            location="Pittsburgh", category=category,
+            customer=self._customer("seller"),
+        )
+
+        self.orders = []
+        for index in range(self.THREADS):
+            customer = self._customer(f"buyer{index}")
+            order = Order.objects.create(customer=customer, created_date="2025-07-16")
+            OrderProduct.objects.create(order=order, product=self.product)
+            payment = Payment.objects.create(
+                merchant_name="Chase", account_number="1234", customer=customer,
+                create_date="2025-07-16", expiration_date="2026-07-01")
+            self.orders.append((order, payment))
+
+    def _customer(self, username):
+        user = User.objects.create_user(username=username, password="Admin8*")
+        return Customer.objects.create(user=user, phone_number="555-1212", address="1 Way")
+
+    @override_settings(CHECKOUT_RETRIES=100)
+    def test_hot_product_is_never_oversold(self):
+        """
+        Ensure many buyers racing for the last units of one product never oversell it.
+        """
+        outcomes = []
+        start = threading.Barrier(self.THREADS)
+
+        def checkout(order, payment):
+            try:
+                start.wait()
+                order.complete(payment)
+                outcomes.append("sold")
+            except OutOfStock:
+                outcomes.append("out of stock")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=pair) for pair in self.orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count("sold"), self.STOCK)
+        self.assertEqual(outcomes.count("out of stock"), self.THREADS - self.STOCK)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(self.product.units_sold, self.STOCK)
+        self.assertEqual(
+            Order.objects.filter(payment_type__isnull=False).count(), self.STOCK)
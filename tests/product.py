@@ -1,7 +1,20 @@
+import base64
+import io
 import json
 import datetime
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
 from rest_framework import status
 from rest_framework.test import APITestCase
+from bangazonapi import catalogcache, thumbnails
+from bangazonapi.models import Location, Product, ProductCategory
 
 
 class ProductTests(APITestCase):
@@ -116,3 +129,546 @@ class ProductTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     # TODO: Product can be rated. Assert average rating exists.
+
+    def test_filter_products_by_number_sold(self):
+        """
+        Ensure number_sold filtering only counts items on completed orders.
+        """
+        self.test_create_product()
+        self.test_create_product()
+
+        url = "/payment-types"
+        data = {
+            "merchant_name": "Chase",
+            "account_number": "1234123412341234",
+            "expiration_date": "2026-07-01",
+            "create_date": datetime.date.today()
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post(url, data, format='json')
+
+        self.client.post("/cart", {"product_id": 1}, format='json')
+        response = self.client.get("/cart", format='json')
+        order_id = json.loads(response.content)["id"]
+        self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format='json')
+
+        # Product 2 sits in an open cart and is not sold yet
+        self.client.post("/cart", {"product_id": 2}, format='json')
+
+        response = self.client.get("/products?number_sold=1&category=1", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product["id"] for product in json_response], [1])
+
+        for url in ("/products", "/products/facets", "/products/export"):
+            response = self.client.get(url, {"number_sold": "abc"})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginate_products_with_cursor(self):
+        """
+        Ensure products can be walked page by page with the Link cursor.
+        """
+        for _ in range(5):
+            self.test_create_product()
+
+        url = "/products?order_by=price&direction=desc&page_size=2&count=true"
+        seen = []
+        pages = 0
+        while url is not None:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["X-Total-Count"], "5")
+            seen.extend(product["id"] for product in json.loads(response.content))
+            pages += 1
+
+            link = response.get("Link")
+            url = link[1:link.index(">")] if link else None
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, [5, 4, 3, 2, 1])
+
+        response = self.client.get("/products?cursor=bogus", format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Decodes fine, but the values do not fit the sort fields
+        for order_by, position in (("price", ["abc", "def"]), ("price", [{}, []]),
+                                   ("created_date", ["never", 1])):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get("/products", {"order_by": order_by, "cursor": cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_products(self):
+        """
+        Ensure products can be found by text, ranked and filtered by category.
+        """
+        self.test_create_product()
+
+        url = "/products"
+        data = {
+            "name": "Tent",
+            "price": 99.99,
+            "quantity": 5,
+            "description": "Sleeps four, great for a kite festival",
+            "category_id": 1,
+            "location": "Denver"
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post(url, data, format='json')
+
+        response = self.client.get("/products?q=kites", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product["name"] for product in json_response], ["Kite", "Tent"])
+
+        response = self.client.get("/products?q=denver&category=1", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([product["name"] for product in json_response], ["Tent"])
+
+        response = self.client.get("/products?q=kite&category=2", format='json')
+        self.assertEqual(json.loads(response.content), [])
+
+        # Pages follow the relevance order and combine with other filters
+        url = "/products?q=kite&number_sold=0&page_size=1"
+        seen = []
+        while url is not None:
+            response = self.client.get(url, format='json')
+            seen.extend(product["name"] for product in json.loads(response.content))
+            link = response.get("Link")
+            url = link[1:link.index(">")] if link else None
+        self.assertEqual(seen, ["Kite", "Tent"])
+
+        # Deleted products drop out of the index
+        self.client.delete("/products/1")
+        response = self.client.get("/products?q=kite", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([product["name"] for product in json_response], ["Tent"])
+
+    def test_product_facets(self):
+        """
+        Ensure facet counts follow the same filters as the product list.
+        """
+        self.test_create_product()
+        self.test_create_product()
+
+        url = "/products"
+        data = {
+            "name": "Tent",
+            "price": 99.99,
+            "quantity": 5,
+            "description": "Sleeps four",
+            "category_id": 1,
+            "location": "Denver"
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post(url, data, format='json')
+
+        response = self.client.get("/products/facets", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["count"], 3)
+        self.assertEqual(json_response["categories"], [{"id": 1, "name": "Sporting Goods", "count": 3}])
+        self.assertEqual(
+            json_response["locations"],
+            [{"location": "Pittsburgh", "count": 2}, {"location": "Denver", "count": 1}])
+        buckets = {bucket["min"]: bucket["count"] for bucket in json_response["prices"]}
+        self.assertEqual(buckets[10], 2)
+        self.assertEqual(buckets[50], 1)
+        self.assertEqual(sum(buckets.values()), 3)
+
+        response = self.client.get("/products/facets?q=tent", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["count"], 1)
+        self.assertEqual(json_response["locations"], [{"location": "Denver", "count": 1}])
+
+        # Product 1 sells on two orders, the join with line items must
+        # still count it once
+        data = {
+            "merchant_name": "Chase",
+            "account_number": "1234123412341234",
+            "expiration_date": "2026-07-01",
+            "create_date": datetime.date.today()
+        }
+        self.client.post("/payment-types", data, format='json')
+        for _ in range(2):
+            self.client.post("/cart", {"product_id": 1}, format='json')
+            order_id = json.loads(self.client.get("/cart", format='json').content)["id"]
+            self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format='json')
+
+        response = self.client.get("/products/facets?number_sold=1", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["count"], 1)
+        self.assertEqual(json_response["categories"], [{"id": 1, "name": "Sporting Goods", "count": 1}])
+        self.assertEqual(json_response["locations"], [{"location": "Pittsburgh", "count": 1}])
+        self.assertEqual(sum(bucket["count"] for bucket in json_response["prices"]), 1)
+
+    def test_product_responses_are_cached_per_catalog_version(self):
+        """
+        Ensure product reads are cached and writes invalidate them.
+        """
+        self.test_create_product()
+
+        response = self.client.get("/products/1", format='json')
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get("/products/1", format='json')
+        self.assertEqual(response["X-Cache"], "HIT")
+
+        response = self.client.get("/products", format='json')
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response["Content-Type"], "application/json")
+        response = self.client.get("/products", format='json')
+        self.assertEqual(response["X-Cache"], "HIT")
+
+        # Soft deleting the product must not leave it in cached responses
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.delete("/products/1")
+
+        response = self.client.get("/products/1", format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get("/products", format='json')
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_catalog_cache_sees_writes_from_other_processes(self):
+        """
+        Ensure a version bump in another process invalidates cached responses.
+        """
+        bump_elsewhere = multiprocessing.get_context("fork").Process(
+            target=catalogcache.bump_catalog_version)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        shared = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "catalog": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                        "LOCATION": cache_dir},
+        }
+
+        with self.settings(CACHES=shared, CATALOG_CACHE_BACKEND="catalog"):
+            self.assertEqual(catalogcache.fetch("other-process", lambda: 1), (1, False))
+            self.assertEqual(catalogcache.fetch("other-process", lambda: 2), (1, True))
+            bump_elsewhere.start()
+            bump_elsewhere.join()
+            self.assertEqual(catalogcache.fetch("other-process", lambda: 3), (3, False))
+
+        # Without a shared version, local entries only live for a moment
+        with self.settings(CATALOG_CACHE_LOCAL_TTL=0.05):
+            self.assertEqual(catalogcache.fetch("local-only", lambda: 1), (1, False))
+            self.assertEqual(catalogcache.fetch("local-only", lambda: 2), (1, True))
+            time.sleep(0.1)
+            self.assertEqual(catalogcache.fetch("local-only", lambda: 3), (3, False))
+
+    def test_conditional_get_product(self):
+        """
+        Ensure an unchanged product answers 304 and a changed one does not.
+        """
+        self.test_create_product()
+
+        response = self.client.get("/products/1", format='json')
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        response = self.client.get("/products/1", format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get("/productcategories", format='json')
+        category_etag = response["ETag"]
+        response = self.client.get("/productcategories", format='json', HTTP_IF_NONE_MATCH=category_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        data = {
+            "name": "Kite",
+            "price": 9.99,
+            "quantity": 60,
+            "description": "It flies high",
+            "category_id": 1,
+            "created_date": datetime.date.today(),
+            "location": "Pittsburgh"
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.put("/products/1", data, format='json')
+
+        response = self.client.get("/products/1", format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content)["price"], 9.99)
+
+        # Renaming the category changes the expanded product
+        response = self.client.get("/products/1?expand=category", format='json')
+        etag = response["ETag"]
+        category = ProductCategory.objects.get(pk=1)
+        category.name = "Outdoors"
+        category.save()
+        response = self.client.get(
+            "/products/1?expand=category", format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)["category"]["name"], "Outdoors")
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_product_images_are_stored_by_content(self):
+        """
+        Ensure multipart and base64 uploads of one image share a stored file.
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), "red").save(buffer, format="PNG")
+        png = buffer.getvalue()
+
+        data = {
+            "name": "Kite",
+            "price": 14.99,
+            "quantity": 60,
+            "description": "It flies high",
+            "category_id": 1,
+            "location": "Pittsburgh",
+            "image": SimpleUploadedFile("kite.png", png, content_type="image/png"),
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post("/products", data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        json_response = json.loads(response.content)
+        uploaded_path = json_response["image_path"]
+        self.assertRegex(uploaded_path, r"/products/[0-9a-f]{64}\.png$")
+        self.assertRegex(json_response["image_variants"]["thumbnail_webp"], r"-thumbnail\.webp$")
+        self.assertRegex(json_response["image_variants"]["medium_jpeg"], r"-medium\.jpg$")
+
+        data["image_path"] = "data:image/png;base64," + base64.b64encode(png).decode()
+        del data["image"]
+        response = self.client.post("/products", data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)["image_path"], uploaded_path)
+
+        data["image_path"] = "data:text/html;base64,PGgxPg=="
+        response = self.client.post("/products", data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Line wrapped base64 longer than one decoding slice
+        noise = io.BytesIO()
+        Image.frombytes("RGB", (160, 160), os.urandom(160 * 160 * 3)).save(noise, format="PNG")
+        data["image_path"] = "data:image/png;base64," + base64.encodebytes(noise.getvalue()).decode()
+        response = self.client.post("/products", data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            default_storage.open(json.loads(response.content)["image_path"].split("/media/")[-1]).read(),
+            noise.getvalue())
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_image_variants_update_product_version(self):
+        """
+        Ensure recorded variants change the ETag and an unreadable image is not a 500.
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        data = {
+            "name": "Kite",
+            "price": 14.99,
+            "quantity": 60,
+            "description": "It flies high",
+            "category_id": 1,
+            "location": "Pittsburgh",
+            "image": SimpleUploadedFile("kite.png", b"not a png", content_type="image/png"),
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        with self.settings(MEDIA_ROOT=media_root), self.assertLogs("bangazonapi.views.product"):
+            response = self.client.post("/products", data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["image_variants"], {})
+
+        response = self.client.get("/products/1", format='json')
+        etag = response["ETag"]
+        source = Product.objects.get(pk=1).image_path.name
+        thumbnails.record_variants(source, thumbnails.variant_names(source))
+
+        response = self.client.get("/products/1", format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("thumbnail_webp", json.loads(response.content)["image_variants"])
+
+    def test_bulk_import_products(self):
+        """
+        Ensure CSV and JSON Lines imports create products and report bad rows.
+        """
+        csv_body = (
+            "name,price,description,quantity,location,category\n"
+            "Kite,14.99,It flies high,60,Pittsburgh,sporting goods\n"
+            "Ball,not a price,Round,5,Denver,Sporting Goods\n"
+            "Bat,29.99,\"Ash, 34 inch\",10,Boston,Sporting Goods\n"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(
+            "/products/import?batch_size=1", csv_body, content_type="text/csv")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json_response["created"], 2)
+        self.assertEqual(json_response["errors"], [{"row": 2, "message": "price must be a number"}])
+
+        jsonl_body = "\n".join([
+            json.dumps({"name": "Tent", "price": 99.5, "description": "Sleeps four",
+                        "quantity": 3, "location": "Denver", "category_id": 1}),
+            json.dumps({"name": "Boat", "price": 500, "description": "Floats",
+                        "quantity": 1, "location": "Denver", "category_id": 99}),
+            "{broken",
+        ])
+        response = self.client.post(
+            "/products/import", jsonl_body, content_type="application/x-ndjson")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["created"], 1)
+        self.assertEqual([error["row"] for error in json_response["errors"]], [2, 3])
+
+        response = self.client.get("/products?q=ash", format='json')
+        self.assertEqual([product["name"] for product in json.loads(response.content)], ["Bat"])
+        response = self.client.get("/products?count=true", format='json')
+        self.assertEqual(response["X-Total-Count"], "3")
+
+    def test_bulk_update_products(self):
+        """
+        Ensure sellers can reprice and restock many of their products at once.
+        """
+        self.test_create_product()
+        self.test_create_product()
+
+        patches = [
+            {"id": 1, "price": 9.99},
+            {"id": 2, "quantity": -1},
+            {"id": 42, "quantity": 1},
+            {"price": 1.00},
+            {"quantity": "many"},
+        ]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.patch("/products/bulk", patches, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["updated"], [1])
+        self.assertEqual(json_response["not_found"], [42])
+        self.assertEqual(json_response["invalid"], [
+            {"index": 1, "id": 2, "errors": ["quantity cannot be negative"]},
+            {"index": 3, "id": None, "errors": ["id is required"]},
+            {"index": 4, "id": None, "errors": ["id is required"]},
+        ])
+
+        response = self.client.get("/products/1", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["price"], 9.99)
+        self.assertEqual(json_response["quantity"], 60)
+
+    def test_sparse_fields_and_expand(self):
+        """
+        Ensure clients can pick product fields and opt into nested objects.
+        """
+        self.test_create_product()
+
+        response = self.client.get("/products?fields=id,name,price", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response, [{"id": 1, "name": "Kite", "price": 14.99}])
+
+        response = self.client.get("/products/1?fields=id&expand=category", format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(set(json_response), {"id", "category"})
+        self.assertEqual(json_response["category"]["id"], 1)
+
+        response = self.client.get("/products?fields=id,secret", format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_products(self):
+        """
+        Ensure the catalog can be streamed as JSON Lines.
+        """
+        self.test_create_product()
+        self.test_create_product()
+
+        with self.settings(PRODUCT_EXPORT_CHUNK_SIZE=1):
+            response = self.client.get("/products/export?fields=id,name")
+            lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual([json.loads(line) for line in lines], [
+            {"id": 1, "name": "Kite"},
+            {"id": 2, "name": "Kite"},
+        ])
+
+    def test_products_near_a_point(self):
+        """
+        Ensure products can be found by distance from a point.
+        """
+        Location.objects.create(name="Pittsburgh", latitude=40.4406, longitude=-79.9959)
+        Location.objects.create(name="Philadelphia", latitude=39.9526, longitude=-75.1652)
+        self.test_create_product()
+
+        url = "/products"
+        data = {
+            "name": "Bell",
+            "price": 4.99,
+            "quantity": 10,
+            "description": "It rings",
+            "category_id": 1,
+            "location": "philadelphia"
+        }
+        self.client.post(url, data, format='json')
+
+        response = self.client.get("/products?near=40.0,-76.0&radius_km=500&fields=id,distance")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product["id"] for product in json_response], [2, 1])
+        self.assertAlmostEqual(json_response[0]["distance"], 71.3, delta=0.5)
+
+        response = self.client.get("/products?near=40.44,-80.0&radius_km=50")
+        json_response = json.loads(response.content)
+        self.assertEqual([product["id"] for product in json_response], [1])
+
+        response = self.client.get("/products?near=north")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_category_counts_and_preview(self):
+        """
+        Ensure categories report live product counts and a preview of their newest products.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        self.test_create_product()
+        self.client.delete("/products/1")
+
+        response = self.client.get("/productcategories")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response[0]["product_count"], 2)
+
+        response = self.client.get("/productcategories/preview?limit=1&fields=id")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response[0]["products"], [{"id": 3}])
+
+        data = {
+            "name": "Kite",
+            "price": 14.99,
+            "quantity": 60,
+            "description": "It flies high",
+            "category_id": 99,
+            "location": "Pittsburgh"
+        }
+        response = self.client.post("/products", data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rate_product(self):
+        """
+        Ensure customers can rate a product and see the rating summary.
+        """
+        self.test_create_product()
+
+        response = self.client.post("/products/1/rate", {"rating": 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Rating again replaces the earlier rating
+        response = self.client.post("/products/1/rate", {"rating": 2}, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["rating_count"], 1)
+        self.assertEqual(json_response["average_rating"], 2)
+        self.assertEqual(json_response["rating_distribution"],
+                         {"0": 0, "1": 0, "2": 1, "3": 0, "4": 0, "5": 0})
+
+        response = self.client.post("/products/1/rate", {"rating": 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)